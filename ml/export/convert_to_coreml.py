@@ -4,10 +4,18 @@ Convert PyTorch BERT token classifier to CoreML format.
 Usage:
     python ml/export/convert_to_coreml.py filler
     python ml/export/convert_to_coreml.py repetition
+    python ml/export/convert_to_coreml.py filler --compress palette4
+
+Compression modes:
+    fp16      - Default CoreML FP16 weights (~110MB per BERT)
+    int8      - Per-block linear int8 weight quantization (macOS 15+)
+    palette4  - 4-bit k-means palettization, per grouped channel (macOS 15+)
 """
 
+import gc
 import sys
 import os
+import shutil
 from pathlib import Path
 
 # Add parent to path
@@ -19,7 +27,53 @@ from transformers import AutoTokenizer, AutoModelForTokenClassification
 import numpy as np
 
 
-def convert_bert_classifier(model_name: str):
+COMPRESSION_MODES = ["fp16", "int8", "palette4"]
+
+
+def compress_weights(mlmodel, mode: str):
+    """
+    Compress CoreML weights to cut model size and DRAM traffic on the ANE.
+
+    Args:
+        mlmodel: Converted CoreML model (FP16 weights)
+        mode: One of COMPRESSION_MODES
+
+    Returns:
+        Compressed model (or the input unchanged for "fp16")
+    """
+    if mode == "fp16":
+        return mlmodel
+
+    from coremltools.optimize.coreml import (
+        OptimizationConfig,
+        OpLinearQuantizerConfig,
+        OpPalettizerConfig,
+        linear_quantize_weights,
+        palettize_weights,
+    )
+
+    if mode == "int8":
+        config = OptimizationConfig(global_config=OpLinearQuantizerConfig(
+            mode="linear_symmetric",
+            dtype="int8",
+            granularity="per_block",
+            block_size=32,
+        ))
+        return linear_quantize_weights(mlmodel, config)
+
+    if mode == "palette4":
+        config = OptimizationConfig(global_config=OpPalettizerConfig(
+            mode="kmeans",
+            nbits=4,
+            granularity="per_grouped_channel",
+            group_size=16,
+        ))
+        return palettize_weights(mlmodel, config)
+
+    raise ValueError(f"Unknown compression mode: {mode}. Available: {COMPRESSION_MODES}")
+
+
+def convert_bert_classifier(model_name: str, compress: str = "fp16"):
     """Convert a BERT token classifier to CoreML."""
 
     model_path = Path(__file__).parent.parent / "models" / f"{model_name}-remover"
@@ -69,13 +123,26 @@ def convert_bert_classifier(model_name: str):
     wrapped_model = TracingWrapper(model)
     wrapped_model.eval()
 
-    traced_model = torch.jit.trace(
-        wrapped_model,
-        (inputs["input_ids"], inputs["attention_mask"])
-    )
+    with torch.no_grad():
+        traced_model = torch.jit.trace(
+            wrapped_model,
+            (inputs["input_ids"], inputs["attention_mask"])
+        )
+
+    # Keep only what the metadata needs; the trace holds the weights from here on
+    id2label = model.config.id2label
+    label2id = model.config.label2id
+    del model, wrapped_model
+    gc.collect()
 
     print("Converting to CoreML...")
 
+    # Grouped-channel palettization and per-block quantization need macOS 15
+    if compress == "fp16":
+        deployment_target = ct.target.macOS13
+    else:
+        deployment_target = ct.target.macOS15
+
     # Convert to CoreML
     mlmodel = ct.convert(
         traced_model,
@@ -86,18 +153,27 @@ def convert_bert_classifier(model_name: str):
         outputs=[
             ct.TensorType(name="logits"),
         ],
-        minimum_deployment_target=ct.target.macOS13,
+        minimum_deployment_target=deployment_target,
     )
 
+    # The CoreML model has its own copy of the weights now
+    del traced_model
+    gc.collect()
+
+    if compress != "fp16":
+        print(f"Compressing weights ({compress})...")
+        mlmodel = compress_weights(mlmodel, compress)
+
     # Add metadata
     mlmodel.author = "Whisper Village"
     mlmodel.short_description = f"BERT-based {model_name} word remover for transcript cleanup"
     mlmodel.version = "1.0"
 
     # Add label mapping as user-defined metadata
-    mlmodel.user_defined_metadata["id2label"] = str(model.config.id2label)
-    mlmodel.user_defined_metadata["label2id"] = str(model.config.label2id)
+    mlmodel.user_defined_metadata["id2label"] = str(id2label)
+    mlmodel.user_defined_metadata["label2id"] = str(label2id)
     mlmodel.user_defined_metadata["max_seq_len"] = str(MAX_SEQ_LEN)
+    mlmodel.user_defined_metadata["compression"] = compress
 
     # Save
     output_path.parent.mkdir(parents=True, exist_ok=True)
@@ -106,6 +182,13 @@ def convert_bert_classifier(model_name: str):
     print(f"\nSaved CoreML model to: {output_path}")
     print(f"Model size: {sum(f.stat().st_size for f in output_path.rglob('*') if f.is_file()) / 1024 / 1024:.1f} MB")
 
+    # Also save the compiled .mlmodelc so the runtime can skip compile-on-load
+    compiled_path = output_path.with_suffix(".mlmodelc")
+    if compiled_path.exists():
+        shutil.rmtree(compiled_path)
+    shutil.copytree(mlmodel.get_compiled_model_path(), compiled_path)
+    print(f"Saved compiled model to: {compiled_path}")
+
     # Also export the tokenizer vocab for Swift
     vocab_path = output_path.parent / f"{model_name}_vocab.json"
     tokenizer.save_pretrained(str(output_path.parent / f"{model_name}_tokenizer"))
@@ -179,12 +262,12 @@ def test_coreml_model(model_name: str):
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python convert_to_coreml.py <model_name>")
-        print("  model_name: 'filler' or 'repetition'")
-        sys.exit(1)
-
-    model_name = sys.argv[1]
-
-    if convert_bert_classifier(model_name):
-        test_coreml_model(model_name)
+    import argparse
+    parser = argparse.ArgumentParser(description='Convert a BERT token classifier to CoreML')
+    parser.add_argument('model_name', help="Model to convert: 'filler', 'repetition' or 'repair'")
+    parser.add_argument('--compress', choices=COMPRESSION_MODES, default='fp16',
+                        help='Weight compression mode (default: fp16)')
+    args = parser.parse_args()
+
+    if convert_bert_classifier(args.model_name, args.compress):
+        test_coreml_model(args.model_name)
@@ -0,0 +1,173 @@
+"""
+Convert PyTorch BERT token classifier to ONNX format.
+
+The exported model has dynamic batch and sequence axes, so ONNX Runtime
+can run padded batches of any length (see ONNXBaseModel in
+ml/pipeline/models.py).
+
+Usage:
+    python ml/export/convert_to_onnx.py filler
+    python ml/export/convert_to_onnx.py repetition
+    python ml/export/convert_to_onnx.py filler --quantize
+
+--quantize also writes <name>_remover.int8.onnx (dynamic QUInt8 weight
+quantization), which the runtime loads when WV_ONNX_INT8=1.
+"""
+
+import sys
+from pathlib import Path
+
+# Add parent to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+import torch
+from transformers import AutoTokenizer, AutoModelForTokenClassification
+import numpy as np
+
+from ml.pipeline.models import LogitsWrapper
+
+
+OPSET_VERSION = 17
+
+
+def export_onnx(model, tokenizer, output_path: Path):
+    """
+    Export a loaded token classifier to ONNX with dynamic batch/sequence axes.
+
+    Args:
+        model: Eval-mode AutoModelForTokenClassification
+        tokenizer: Its tokenizer (used to build the tracing example)
+        output_path: Where to write the .onnx file
+    """
+    example_text = "i uh think um we should go"
+    inputs = tokenizer(example_text, return_tensors="pt")
+
+    wrapped_model = LogitsWrapper(model)
+    wrapped_model.eval()
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with torch.no_grad():
+        torch.onnx.export(
+            wrapped_model,
+            (inputs["input_ids"], inputs["attention_mask"]),
+            str(output_path),
+            opset_version=OPSET_VERSION,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch", 1: "sequence"},
+            },
+        )
+
+
+def quantize_onnx(onnx_path: Path) -> Path:
+    """
+    Write a dynamically int8-quantized copy of an ONNX export.
+
+    Args:
+        onnx_path: fp32 .onnx file
+
+    Returns:
+        Path of the .int8.onnx file
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    int8_path = onnx_path.with_suffix(".int8.onnx")
+    quantize_dynamic(str(onnx_path), str(int8_path), weight_type=QuantType.QUInt8)
+    return int8_path
+
+
+def convert_bert_classifier(model_name: str):
+    """Export a BERT token classifier to ONNX."""
+
+    model_path = Path(__file__).parent.parent / "models" / f"{model_name}-remover"
+    output_path = Path(__file__).parent.parent / "onnx" / f"{model_name}_remover.onnx"
+
+    print(f"Loading model from {model_path}...")
+
+    if not model_path.exists():
+        print(f"ERROR: Model not found at {model_path}")
+        return False
+
+    # Load the model and tokenizer
+    tokenizer = AutoTokenizer.from_pretrained(str(model_path))
+    model = AutoModelForTokenClassification.from_pretrained(str(model_path))
+    model.eval()
+
+    print(f"Model loaded. Labels: {model.config.id2label}")
+
+    print("Exporting to ONNX...")
+    export_onnx(model, tokenizer, output_path)
+
+    print(f"\nSaved ONNX model to: {output_path}")
+    print(f"Model size: {output_path.stat().st_size / 1024 / 1024:.1f} MB")
+
+    return True
+
+
+def test_onnx_model(model_name: str):
+    """Test the exported ONNX model against PyTorch."""
+    import onnxruntime as ort
+
+    model_path = Path(__file__).parent.parent / "models" / f"{model_name}-remover"
+    onnx_path = Path(__file__).parent.parent / "onnx" / f"{model_name}_remover.onnx"
+
+    if not onnx_path.exists():
+        print(f"ONNX model not found at {onnx_path}")
+        return
+
+    print("\nTesting ONNX model...")
+
+    # Load both models
+    tokenizer = AutoTokenizer.from_pretrained(str(model_path))
+    pytorch_model = AutoModelForTokenClassification.from_pretrained(str(model_path))
+    pytorch_model.eval()
+
+    session = ort.InferenceSession(str(onnx_path), providers=["CPUExecutionProvider"])
+
+    # Padded batch of different lengths exercises the dynamic axes
+    test_texts = [
+        "i uh think um we should go",
+        "so basically um you know like it was",
+        "hello world",
+    ]
+
+    inputs = tokenizer(test_texts, return_tensors="pt", padding=True)
+
+    with torch.no_grad():
+        pytorch_logits = pytorch_model(**inputs).logits
+    pytorch_preds = torch.argmax(pytorch_logits, dim=2).numpy()
+
+    onnx_logits = session.run(["logits"], {
+        "input_ids": inputs["input_ids"].numpy(),
+        "attention_mask": inputs["attention_mask"].numpy(),
+    })[0]
+    onnx_preds = np.argmax(onnx_logits, axis=2)
+
+    for i, text in enumerate(test_texts):
+        match = np.array_equal(pytorch_preds[i], onnx_preds[i])
+        print(f"\nInput: '{text}'")
+        print(f"  PyTorch preds (first 20): {pytorch_preds[i][:20]}")
+        print(f"  ONNX preds (first 20):    {onnx_preds[i][:20]}")
+        print(f"  Match: {'✓' if match else '✗'}")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Convert a BERT token classifier to ONNX')
+    parser.add_argument('model_name', help="Model to convert: 'filler', 'repetition' or 'repair'")
+    parser.add_argument('--quantize', action='store_true',
+                        help='Also write a dynamic int8 (QUInt8) copy')
+    args = parser.parse_args()
+
+    if convert_bert_classifier(args.model_name):
+        test_onnx_model(args.model_name)
+
+        if args.quantize:
+            onnx_path = Path(__file__).parent.parent / "onnx" / f"{args.model_name}_remover.onnx"
+            int8_path = quantize_onnx(onnx_path)
+            print(f"\nSaved int8 ONNX model to: {int8_path}")
+            print(f"Model size: {int8_path.stat().st_size / 1024 / 1024:.1f} MB")
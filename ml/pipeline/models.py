@@ -12,28 +12,205 @@ To add a new model:
 3. Implement any custom label handling if needed
 """
 
+import ast
+import functools
+import hashlib
+import importlib.util
 import os
+import platform
+import re
+import string
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Optional
+import numpy as np
 import torch
-from transformers import AutoTokenizer, AutoModelForTokenClassification, T5Tokenizer, T5ForConditionalGeneration
+from transformers import AutoConfig, AutoModel, AutoTokenizer, AutoModelForTokenClassification, T5Tokenizer, T5ForConditionalGeneration
 
 
 # Base path for all models
 MODELS_BASE_PATH = Path(__file__).parent.parent / "models"
 
+# Base path for CoreML exports (written by ml/export/convert_to_coreml.py)
+COREML_BASE_PATH = Path(__file__).parent.parent / "coreml"
+
+# Base path for ONNX exports (written by ml/export/convert_to_onnx.py)
+ONNX_BASE_PATH = Path(__file__).parent.parent / "onnx"
+
+# Fillers the filler model always removes (uh, um, er, ah, hmm, mhm...)
+# ("er"/"erm" only - "err" is a real word, so elongated er-fillers go to the model)
+FILLER_WORD_RE = re.compile(r"(?:u+h+|u+h*m+|erm*|a+h+|h+m+|m+h*m+)", re.IGNORECASE)
+
+# Other words DisfluencySpeech sometimes tags as fillers - need the model
+AMBIGUOUS_FILLER_RE = re.compile(r"(?:oh+|huh|eh|ooh|uh-huh|um-hum)", re.IGNORECASE)
+
+# " - " followed by a capital letter (list item) but not at start
+BULLET_FIX_RE = re.compile(r'(?<!^)(\s-\s)(?=[A-Z])')
+
+# ListFormatter is trained on lists introduced by number words or ordinals
+# ("one X two Y", "first X second Y"); without one there's nothing to format
+LIST_TRIGGER_RE = re.compile(
+    r"\b(?:one|two|three|four|five|first|second|third|fourth|fifth|\d+)\b",
+    re.IGNORECASE
+)
+
+# How far ahead a repeated word can appear and still be a repetition
+REPETITION_WINDOW = 8
+
+# TorchScript-trace BERT models at load time (set WV_JIT=0 to disable)
+JIT_ENABLED = os.environ.get("WV_JIT", "1") == "1"
+JIT_TRACE_SEQ_LEN = 128
+
+# Export missing ONNX files from the PyTorch checkpoints on first load
+# (instead of requiring ml/export/convert_to_onnx.py to be run by hand)
+ONNX_AUTO_EXPORT = os.environ.get("WV_ONNX_EXPORT", "0") == "1"
+
+# Prefer the int8 ONNX export (<name>.int8.onnx, from convert_to_onnx.py
+# --quantize) when it exists. Off by default so CI compares fp32 outputs.
+ONNX_INT8 = os.environ.get("WV_ONNX_INT8", "0") == "1"
+
+# Inference weight precision: fp32 (default), bf16, or int8 (dynamic
+# quantization of the Linear layers). The taggers are memory-bound at small
+# batch sizes on CPU, so narrower weights translate almost directly to speed.
+ML_DTYPE = os.environ.get("ML_DTYPE", "fp32")
+DTYPES = ("fp32", "bf16", "int8")
+
+# Let ml/server.py run a MultiHeadRemover checkpoint in place of the separate
+# filler/repetition models (set WV_FUSE_HEADS=1). Opt-in: the heads label the
+# original text in one pass, so results can differ from sequential cleanup.
+FUSE_HEADS = os.environ.get("WV_FUSE_HEADS", "0") == "1"
+
+
+# Files that define a tokenizer; models whose copies match share one instance
+TOKENIZER_FILES = ("tokenizer.json", "vocab.txt", "tokenizer_config.json", "special_tokens_map.json")
+
+_tokenizer_cache: dict = {}
+_tokenizer_cache_lock = threading.Lock()
+
+# Fast tokenizers mutate padding/truncation state per call, so calls on a
+# shared instance from several threads (e.g. server batchers) must not overlap
+TOKENIZER_LOCK = threading.Lock()
+
+
+def _tokenizer_fingerprint(path: Path) -> str:
+    """Hash a model directory's tokenizer files."""
+    digest = hashlib.sha1()
+    for name in TOKENIZER_FILES:
+        file = path / name
+        if file.exists():
+            digest.update(name.encode())
+            digest.update(file.read_bytes())
+    return digest.hexdigest()
+
+
+def load_tokenizer(path: Path):
+    """
+    Load a fast (Rust) tokenizer, shared across models with identical vocab.
+
+    All the DistilBERT cleanup models are fine-tuned from the same base, so
+    they end up sharing a single tokenizer instance.
+    """
+    key = _tokenizer_fingerprint(path)
+    with _tokenizer_cache_lock:
+        if key not in _tokenizer_cache:
+            _tokenizer_cache[key] = AutoTokenizer.from_pretrained(str(path), use_fast=True)
+        return _tokenizer_cache[key]
+
+
+# Per-row fast-tokenizer output, keyed by (tokenizer, words, truncation
+# length). Models that share a tokenizer (see load_tokenizer) share entries,
+# so when one pipeline stage leaves the text unchanged the next one reuses
+# its encoding instead of tokenizing again.
+ENCODING_CACHE_SIZE = 4096
+_encoding_cache: "OrderedDict[tuple, tuple[list[int], list[Optional[int]]]]" = OrderedDict()
+_encoding_cache_lock = threading.Lock()
+
+# Per-thread input_ids/attention_mask buffers reused by _encode_words, so a
+# batcher worker doesn't allocate fresh arrays for every batch
+_encode_buffers = threading.local()
+
+
+def _input_buffers(rows: int, seq_len: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Get this thread's (input_ids, attention_mask) buffers as (rows, seq_len).
+
+    The buffers grow as needed and are overwritten by the next call on the
+    same thread, so callers must be done with them before encoding again.
+    """
+    size = rows * seq_len
+    if getattr(_encode_buffers, "size", 0) < size:
+        _encode_buffers.size = size
+        _encode_buffers.input_ids = np.empty(size, dtype=np.int32)
+        _encode_buffers.attention_mask = np.empty(size, dtype=np.int32)
+
+    # Reshape a flat prefix so the views stay C-contiguous
+    return (
+        _encode_buffers.input_ids[:size].reshape(rows, seq_len),
+        _encode_buffers.attention_mask[:size].reshape(rows, seq_len),
+    )
+
+
+def convert_dtype(module: torch.nn.Module, dtype: str) -> torch.nn.Module:
+    """
+    Convert a model's weights for inference.
+
+    Args:
+        module: Eval-mode PyTorch module
+        dtype: One of DTYPES
+
+    Returns:
+        The converted module (int8 returns a quantized copy)
+    """
+    if dtype == "fp32":
+        return module
+    if dtype == "bf16":
+        return module.to(torch.bfloat16)
+    if dtype == "int8":
+        return torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+    raise ValueError(f"Unknown dtype: {dtype}. Available: {list(DTYPES)}")
+
+
+def to_int32(inputs):
+    """
+    Cast tokenizer input_ids/attention_mask to int32.
+
+    The embedding tables accept int32 indices, which halves the bytes moved
+    through the (memory-bound) embedding lookup.
+    """
+    for key in ("input_ids", "attention_mask"):
+        inputs[key] = inputs[key].to(torch.int32)
+    return inputs
+
+
+class LogitsWrapper(torch.nn.Module):
+    """Wrapper that only takes input_ids and attention_mask and returns logits."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        logits, = self.model(input_ids=input_ids, attention_mask=attention_mask, return_dict=False)
+        return logits
+
 
 class BaseModel:
     """Base class for all cleanup models."""
 
     MODEL_DIR: str = ""  # Override in subclass
 
-    def __init__(self, model_path: Optional[str] = None):
+    # Texts labeled by _fast_labels vs. by the model (for checking hit rate)
+    fast_path_hits: int = 0
+    fast_path_misses: int = 0
+
+    def __init__(self, model_path: Optional[str] = None, dtype: Optional[str] = None):
         """
         Initialize the model.
 
         Args:
             model_path: Optional custom path. If None, uses default in ml/models/
+            dtype: Weight precision (see DTYPES). If None, uses ML_DTYPE
         """
         if model_path:
             self.model_path = Path(model_path)
@@ -46,28 +223,245 @@ class BaseModel:
                 f"Run training script or download the model first."
             )
 
-        self.tokenizer = AutoTokenizer.from_pretrained(str(self.model_path))
+        self.tokenizer = load_tokenizer(self.model_path)
         self.model = AutoModelForTokenClassification.from_pretrained(str(self.model_path))
         self.model.eval()
+        self.model = convert_dtype(self.model, dtype or ML_DTYPE)
+
+        # Plain tuples instead of building a TokenClassifierOutput every call
+        self.model.config.return_dict = False
 
         self.id2label = self.model.config.id2label
 
+        self.is_traced = False
+        if JIT_ENABLED:
+            self._trace_model()
+
+    def _trace_model(self) -> None:
+        """
+        Replace the eager model with a frozen, optimized TorchScript trace.
+
+        The trace is checked against the eager model on a batch with a
+        different shape; if the outputs diverge the eager model is kept.
+        """
+        example = to_int32(self._tokenize(
+            "i uh think um we should go",
+            padding="max_length",
+            max_length=JIT_TRACE_SEQ_LEN,
+            truncation=True,
+            return_tensors="pt"
+        ))
+        check = to_int32(self._tokenize(
+            [["i", "uh", "think"], ["we", "we", "should", "go", "to", "the", "store"]],
+            is_split_into_words=True,
+            padding=True,
+            return_tensors="pt"
+        ))
+
+        try:
+            with torch.no_grad():
+                wrapper = LogitsWrapper(self.model).eval()
+                traced = torch.jit.trace(wrapper, (example["input_ids"], example["attention_mask"]))
+                traced = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+
+                expected = self._forward(check)
+                actual = traced(check["input_ids"], check["attention_mask"])
+        except Exception as e:
+            print(f"[{self.__class__.__name__}] TorchScript trace failed, using eager model: {e}")
+            return
+
+        if actual.shape != expected.shape or not torch.allclose(actual, expected, atol=1e-4):
+            print(f"[{self.__class__.__name__}] TorchScript trace mismatch, using eager model")
+            return
+
+        self.model = traced
+        self.is_traced = True
+
+    def _tokenize(self, *args, **kwargs):
+        """
+        Call the (possibly shared) tokenizer under TOKENIZER_LOCK.
+
+        Only input_ids/attention_mask are produced - single-segment inputs
+        don't need token_type_ids.
+        """
+        kwargs.setdefault("return_token_type_ids", False)
+        kwargs.setdefault("return_attention_mask", True)
+        with TOKENIZER_LOCK:
+            return self.tokenizer(*args, **kwargs)
+
+    def _encode_words(
+        self,
+        word_lists: list[list[str]],
+        max_length: Optional[int] = None
+    ) -> tuple[dict[str, np.ndarray], list[list[Optional[int]]]]:
+        """
+        Tokenize pre-split words for inference.
+
+        Uses the Rust tokenizer's encode_batch directly (skipping the Python
+        BatchEncoding layer) when the tokenizer is fast, and reuses cached
+        rows from _encoding_cache. The returned arrays are this thread's
+        reusable buffers (see _input_buffers) - valid until the next call.
+
+        Args:
+            word_lists: Pre-split words for each text
+            max_length: Pad every row to exactly this length. If None, pads
+                to the longest row (truncating at the model's max length)
+
+        Returns:
+            (inputs, word_ids): int32 input_ids/attention_mask arrays of
+            shape (batch, seq), and each row's token -> word index list
+        """
+        if not self.tokenizer.is_fast:
+            padding = "max_length" if max_length else True
+            encoded = self._tokenize(
+                word_lists,
+                is_split_into_words=True,
+                padding=padding,
+                truncation=True,
+                max_length=max_length,
+                return_tensors="np"
+            )
+            inputs = {key: encoded[key].astype(np.int32) for key in ("input_ids", "attention_mask")}
+            return inputs, [encoded.word_ids(batch_index=row) for row in range(len(word_lists))]
+
+        truncate_to = max_length or self.tokenizer.model_max_length
+        keys = [(id(self.tokenizer), tuple(words), truncate_to) for words in word_lists]
+
+        with _encoding_cache_lock:
+            rows = [_encoding_cache.get(key) for key in keys]
+            for key, row in zip(keys, rows):
+                if row is not None:
+                    _encoding_cache.move_to_end(key)
+
+        missing = [i for i, row in enumerate(rows) if row is None]
+        if missing:
+            backend = self.tokenizer.backend_tokenizer
+            with TOKENIZER_LOCK:
+                backend.enable_truncation(max_length=truncate_to)
+                backend.no_padding()
+                encodings = backend.encode_batch([word_lists[i] for i in missing], is_pretokenized=True)
+
+            with _encoding_cache_lock:
+                for i, encoding in zip(missing, encodings):
+                    rows[i] = (encoding.ids, encoding.word_ids)
+                    _encoding_cache[keys[i]] = rows[i]
+                while len(_encoding_cache) > ENCODING_CACHE_SIZE:
+                    _encoding_cache.popitem(last=False)
+
+        seq_len = max_length or max(len(ids) for ids, _ in rows)
+        input_ids, attention_mask = _input_buffers(len(rows), seq_len)
+        input_ids.fill(self.tokenizer.pad_token_id)
+        attention_mask.fill(0)
+        word_ids = []
+
+        for row, (ids, row_word_ids) in enumerate(rows):
+            input_ids[row, :len(ids)] = ids
+            attention_mask[row, :len(ids)] = 1
+            word_ids.append(row_word_ids + [None] * (seq_len - len(ids)))
+
+        return {"input_ids": input_ids, "attention_mask": attention_mask}, word_ids
+
+    def _forward(self, inputs) -> torch.Tensor:
+        """Run the model on tokenized inputs and return token logits."""
+        if self.is_traced:
+            return self.model(inputs["input_ids"], inputs["attention_mask"])
+        logits, = self.model(input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"])
+        return logits
+
     def _get_word_labels(self, words: list[str]) -> dict[int, str]:
-        """Run inference and get label for each word."""
-        inputs = self.tokenizer(words, is_split_into_words=True, return_tensors="pt")
+        """Get label for each word (fast path or inference)."""
+        return self._label_batch([words])[0]
+
+    def _fast_labels(self, words: list[str]) -> Optional[dict[int, str]]:
+        """
+        Label words without running the model, when the answer is certain.
+
+        Override in subclass. Returns None when the model is needed.
+        """
+        return None
+
+    def _label_batch(self, word_lists: list[list[str]]) -> list[dict[int, str]]:
+        """Label each text, only running the model on texts the fast path can't decide."""
+        batch_labels: list[Optional[dict[int, str]]] = [self._fast_labels(words) for words in word_lists]
+        pending = [i for i, labels in enumerate(batch_labels) if labels is None]
+
+        self.fast_path_hits += len(word_lists) - len(pending)
+        self.fast_path_misses += len(pending)
+
+        if pending:
+            model_labels = self._get_word_labels_batch([word_lists[i] for i in pending])
+            for i, labels in zip(pending, model_labels):
+                batch_labels[i] = labels
+
+        return batch_labels
+
+    def _get_word_labels_batch(self, word_lists: list[list[str]]) -> list[dict[int, str]]:
+        """
+        Run one padded forward pass over several texts.
+
+        Args:
+            word_lists: Pre-split words for each text (must be non-empty)
+
+        Returns:
+            One word-index -> label dict per input, in the same order
+        """
+        encoded, word_ids = self._encode_words(word_lists)
+        inputs = {key: torch.from_numpy(value) for key, value in encoded.items()}
+
+        with torch.inference_mode():
+            logits = self._forward(inputs)
+
+        predictions = torch.argmax(logits, dim=2).numpy()
+
+        return [
+            self._labels_from_predictions(word_ids[row], predictions[row])
+            for row in range(len(word_lists))
+        ]
+
+    def _labels_from_predictions(
+        self,
+        word_ids: list[Optional[int]],
+        predictions: np.ndarray,
+        id2label: Optional[dict[int, str]] = None
+    ) -> dict[int, str]:
+        """Map token predictions to word labels using each word's first subtoken."""
+        label_array = self._label_array(id2label or self.id2label)
+
+        # np.unique returns the first token index of each word id
+        word_ids_np = np.array([-1 if w is None else w for w in word_ids], dtype=np.int64)
+        unique_ids, first_indices = np.unique(word_ids_np, return_index=True)
+        is_word = unique_ids >= 0
+
+        labels = label_array[np.asarray(predictions)[first_indices[is_word]]]
+        return dict(zip(unique_ids[is_word].tolist(), labels.tolist()))
+
+    def _label_array(self, id2label: dict[int, str]) -> np.ndarray:
+        """id2label as an object array, so label lookup is one vectorized gather (built once per mapping)."""
+        arrays = self.__dict__.setdefault("_label_arrays", {})
+        key = id(id2label)
+        if key not in arrays:
+            arrays[key] = np.array(
+                [id2label.get(i, "O") for i in range(max(id2label) + 1)],
+                dtype=object
+            )
+        return arrays[key]
 
-        with torch.no_grad():
-            outputs = self.model(**inputs)
+    def _should_remove(self, label: str) -> bool:
+        """Check if label indicates word should be removed."""
+        return label != "O"
 
-        predictions = torch.argmax(outputs.logits, dim=2)[0]
-        word_ids = inputs.word_ids()
+    def _split_words(self, words: list[str], word_labels: dict[int, str]) -> tuple[list[str], list[str]]:
+        """Split words into (kept, removed) according to their labels."""
+        kept = []
+        removed = []
 
-        word_labels = {}
-        for idx, word_idx in enumerate(word_ids):
-            if word_idx is not None and word_idx not in word_labels:
-                word_labels[word_idx] = self.id2label[predictions[idx].item()]
+        for i, word in enumerate(words):
+            if self._should_remove(word_labels.get(i, "O")):
+                removed.append(word)
+            else:
+                kept.append(word)
 
-        return word_labels
+        return kept, removed
 
     def process(self, text: str) -> str:
         """
@@ -85,11 +479,8 @@ class BaseModel:
         words = text.split()
         word_labels = self._get_word_labels(words)
 
-        # Keep words labeled as "O" (not marked for removal)
-        kept_words = [
-            word for i, word in enumerate(words)
-            if word_labels.get(i, "O") == "O"
-        ]
+        # Keep words not marked for removal
+        kept_words, _ = self._split_words(words, word_labels)
 
         return ' '.join(kept_words)
 
@@ -108,16 +499,7 @@ class BaseModel:
 
         words = text.split()
         word_labels = self._get_word_labels(words)
-
-        kept = []
-        removed = []
-
-        for i, word in enumerate(words):
-            label = word_labels.get(i, "O")
-            if label == "O":
-                kept.append(word)
-            else:
-                removed.append(word)
+        kept, removed = self._split_words(words, word_labels)
 
         return {
             'output': ' '.join(kept),
@@ -125,6 +507,266 @@ class BaseModel:
             'labels': {words[i]: word_labels.get(i, "O") for i in range(len(words))}
         }
 
+    def process_batch(self, texts: list[str]) -> list[str]:
+        """
+        Process several texts with a single padded forward pass.
+
+        Args:
+            texts: Input texts to clean
+
+        Returns:
+            Cleaned texts, in the same order as the inputs
+        """
+        return [result['output'] for result in self.process_with_details_batch(texts)]
+
+    def process_with_details_batch(self, texts: list[str]) -> list[dict]:
+        """
+        Batched version of process_with_details.
+
+        Empty/whitespace-only texts are passed through without inference.
+
+        Args:
+            texts: Input texts to clean
+
+        Returns:
+            List of dicts with 'output', 'removed', and 'labels' keys
+        """
+        results: list[Optional[dict]] = [None] * len(texts)
+        pending = []
+
+        for i, text in enumerate(texts):
+            if text.strip():
+                pending.append(i)
+            else:
+                results[i] = {'output': text, 'removed': [], 'labels': {}}
+
+        if pending:
+            word_lists = [texts[i].split() for i in pending]
+            batch_labels = self._label_batch(word_lists)
+
+            for i, words, word_labels in zip(pending, word_lists, batch_labels):
+                kept, removed = self._split_words(words, word_labels)
+                results[i] = {
+                    'output': ' '.join(kept),
+                    'removed': removed,
+                    'labels': {words[j]: word_labels.get(j, "O") for j in range(len(words))}
+                }
+
+        return results
+
+
+class CoreMLBaseModel(BaseModel):
+    """
+    Base class for cleanup models served through CoreML.
+
+    Runs the .mlpackage exported by ml/export/convert_to_coreml.py with
+    compute_units=ALL, so inference lands on the Neural Engine / GPU
+    instead of CPU PyTorch. Only the tokenizer is loaded from MODEL_DIR.
+
+    The exported model has a fixed (1, max_seq_len) input shape, so batches
+    are predicted row by row.
+
+    If the export also wrote a precompiled .mlmodelc next to the .mlpackage,
+    that is loaded instead, skipping CoreML's compile on first load.
+    """
+
+    COREML_NAME: str = ""  # Override in subclass, e.g. "filler_remover"
+    MAX_SEQ_LEN: int = 128  # Used if the export didn't record max_seq_len
+
+    def __init__(self, model_path: Optional[str] = None, coreml_path: Optional[str] = None):
+        """
+        Initialize the model.
+
+        Args:
+            model_path: Optional custom tokenizer path. If None, uses default in ml/models/
+            coreml_path: Optional custom .mlpackage path. If None, uses default in ml/coreml/
+        """
+        import coremltools as ct
+
+        if model_path:
+            self.model_path = Path(model_path)
+        else:
+            self.model_path = MODELS_BASE_PATH / self.MODEL_DIR
+
+        if coreml_path:
+            self.coreml_path = Path(coreml_path)
+        else:
+            self.coreml_path = self.default_coreml_path()
+
+        if not self.model_path.exists():
+            raise FileNotFoundError(
+                f"Model not found at {self.model_path}. "
+                f"Run training script or download the model first."
+            )
+        if not self.coreml_path.exists():
+            raise FileNotFoundError(
+                f"CoreML model not found at {self.coreml_path}. "
+                f"Run ml/export/convert_to_coreml.py first."
+            )
+
+        self.tokenizer = load_tokenizer(self.model_path)
+
+        compiled_path = self.coreml_path.with_suffix(".mlmodelc")
+        if compiled_path.exists():
+            # Compiled models don't carry user metadata - labels come from the HF config
+            self.model = ct.models.CompiledMLModel(str(compiled_path), compute_units=ct.ComputeUnit.ALL)
+            self.id2label = AutoConfig.from_pretrained(str(self.model_path)).id2label
+            self.max_seq_len = self.MAX_SEQ_LEN
+        else:
+            self.model = ct.models.MLModel(str(self.coreml_path), compute_units=ct.ComputeUnit.ALL)
+            metadata = self.model.user_defined_metadata
+            self.id2label = ast.literal_eval(metadata["id2label"])
+            self.max_seq_len = int(metadata.get("max_seq_len", self.MAX_SEQ_LEN))
+
+    @classmethod
+    def default_coreml_path(cls) -> Path:
+        """Default location of this model's .mlpackage."""
+        return COREML_BASE_PATH / f"{cls.COREML_NAME}.mlpackage"
+
+    @classmethod
+    def is_available(cls) -> bool:
+        """Check if CoreML can run here (macOS, coremltools, exported model)."""
+        return (
+            platform.system() == "Darwin"
+            and importlib.util.find_spec("coremltools") is not None
+            and cls.default_coreml_path().exists()
+        )
+
+    def _get_word_labels_batch(self, word_lists: list[list[str]]) -> list[dict[int, str]]:
+        """Run CoreML inference and get word labels for each text."""
+        inputs, word_ids = self._encode_words(word_lists, max_length=self.max_seq_len)
+        batch_labels = []
+
+        for row in range(len(word_lists)):
+            outputs = self.model.predict({
+                "input_ids": inputs["input_ids"][row:row + 1],
+                "attention_mask": inputs["attention_mask"][row:row + 1],
+            })
+
+            predictions = np.argmax(outputs["logits"], axis=2)[0]
+            batch_labels.append(self._labels_from_predictions(word_ids[row], predictions))
+
+        return batch_labels
+
+
+class ONNXBaseModel(BaseModel):
+    """
+    Base class for cleanup models served through ONNX Runtime.
+
+    Runs the .onnx file exported by ml/export/convert_to_onnx.py with full
+    graph optimization. On macOS the CoreML execution provider routes
+    supported subgraphs to the Neural Engine; elsewhere it runs on the CPU
+    provider. The export has dynamic batch/sequence axes, so batches run
+    padded in a single call.
+    """
+
+    ONNX_NAME: str = ""  # Override in subclass, e.g. "filler_remover"
+
+    def __init__(self, model_path: Optional[str] = None, onnx_path: Optional[str] = None):
+        """
+        Initialize the model.
+
+        Args:
+            model_path: Optional custom tokenizer/config path. If None, uses default in ml/models/
+            onnx_path: Optional custom .onnx path. If None, uses default in ml/onnx/
+        """
+        import onnxruntime as ort
+
+        if model_path:
+            self.model_path = Path(model_path)
+        else:
+            self.model_path = MODELS_BASE_PATH / self.MODEL_DIR
+
+        if onnx_path:
+            self.onnx_path = Path(onnx_path)
+        else:
+            self.onnx_path = self.default_onnx_path()
+
+        if not self.model_path.exists():
+            raise FileNotFoundError(
+                f"Model not found at {self.model_path}. "
+                f"Run training script or download the model first."
+            )
+        if not self.onnx_path.exists():
+            raise FileNotFoundError(
+                f"ONNX model not found at {self.onnx_path}. "
+                f"Run ml/export/convert_to_onnx.py first."
+            )
+
+        self.tokenizer = load_tokenizer(self.model_path)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        providers = ["CPUExecutionProvider"]
+        if "CoreMLExecutionProvider" in ort.get_available_providers():
+            providers.insert(0, ("CoreMLExecutionProvider", {"ModelFormat": "MLProgram"}))
+
+        self.model = ort.InferenceSession(str(self.onnx_path), sess_options=options, providers=providers)
+
+        config = AutoConfig.from_pretrained(str(self.model_path))
+        self.id2label = config.id2label
+
+    @classmethod
+    def default_onnx_path(cls) -> Path:
+        """Default location of this model's .onnx file (int8 copy if enabled and exported)."""
+        if ONNX_INT8:
+            int8_path = ONNX_BASE_PATH / f"{cls.ONNX_NAME}.int8.onnx"
+            if int8_path.exists():
+                return int8_path
+        return ONNX_BASE_PATH / f"{cls.ONNX_NAME}.onnx"
+
+    @classmethod
+    def is_available(cls) -> bool:
+        """Check if ONNX Runtime is installed and the model has been exported."""
+        return (
+            importlib.util.find_spec("onnxruntime") is not None
+            and cls.default_onnx_path().exists()
+        )
+
+    @classmethod
+    def ensure_exported(cls) -> None:
+        """
+        Export this model to ONNX if it hasn't been yet.
+
+        Does nothing when ONNX Runtime isn't installed, the export already
+        exists, or there is no PyTorch checkpoint to export from.
+        """
+        model_path = MODELS_BASE_PATH / cls.MODEL_DIR
+        onnx_path = cls.default_onnx_path()
+
+        if (
+            importlib.util.find_spec("onnxruntime") is None
+            or onnx_path.exists()
+            or not model_path.exists()
+        ):
+            return
+
+        from ml.export.convert_to_onnx import export_onnx
+
+        print(f"[{cls.__name__}] Exporting {model_path.name} to {onnx_path}...")
+        try:
+            model = AutoModelForTokenClassification.from_pretrained(str(model_path)).eval()
+            export_onnx(model, load_tokenizer(model_path), onnx_path)
+        except Exception as e:
+            print(f"[{cls.__name__}] ONNX export failed: {e}")
+            onnx_path.unlink(missing_ok=True)
+
+    def _get_word_labels_batch(self, word_lists: list[list[str]]) -> list[dict[int, str]]:
+        """Run one padded ONNX Runtime call and get word labels for each text."""
+        inputs, word_ids = self._encode_words(word_lists)
+
+        logits = self.model.run(["logits"], {
+            "input_ids": inputs["input_ids"].astype(np.int64),
+            "attention_mask": inputs["attention_mask"].astype(np.int64),
+        })[0]
+        predictions = np.argmax(logits, axis=2)
+
+        return [
+            self._labels_from_predictions(word_ids[row], predictions[row])
+            for row in range(len(word_lists))
+        ]
+
 
 class FillerRemover(BaseModel):
     """
@@ -141,6 +783,17 @@ class FillerRemover(BaseModel):
 
     MODEL_DIR = "filler-remover"
 
+    def _fast_labels(self, words: list[str]) -> Optional[dict[int, str]]:
+        """Drop unambiguous fillers directly; defer to the model for anything else."""
+        labels = {}
+        for i, word in enumerate(words):
+            core = word.strip(string.punctuation)
+            if AMBIGUOUS_FILLER_RE.fullmatch(core):
+                return None
+            if FILLER_WORD_RE.fullmatch(core):
+                labels[i] = "B-FILL"
+        return labels
+
 
 class RepetitionRemover(BaseModel):
     """
@@ -156,6 +809,16 @@ class RepetitionRemover(BaseModel):
 
     MODEL_DIR = "repetition-remover"
 
+    def _fast_labels(self, words: list[str]) -> Optional[dict[int, str]]:
+        """Keep everything if no word recurs within REPETITION_WINDOW words."""
+        last_seen: dict[str, int] = {}
+        for i, word in enumerate(words):
+            key = word.strip(string.punctuation).lower()  # "I, I" repeats "I"
+            if key in last_seen and i - last_seen[key] <= REPETITION_WINDOW:
+                return None
+            last_seen[key] = i
+        return {}
+
 
 class RepairRemover(BaseModel):
     """
@@ -174,29 +837,192 @@ class RepairRemover(BaseModel):
 
     MODEL_DIR = "repair-remover"
 
-    def process(self, text: str) -> str:
+    def _fast_labels(self, words: list[str]) -> Optional[dict[int, str]]:
+        """A repair needs a reparandum and a correction - nothing to do on one word."""
+        if len(words) < 2:
+            return {}
+        return None
+
+    def _should_remove(self, label: str) -> bool:
         """
-        Process text and return cleaned version.
+        Check if label indicates word should be removed.
 
         Overrides base to handle REPAIR labels (not just O).
         """
-        if not text.strip():
-            return text
+        return "REPAIR" in label
 
-        words = text.split()
-        word_labels = self._get_word_labels(words)
 
-        # Keep words labeled as "O" (not REPAIR)
-        kept_words = [
-            word for i, word in enumerate(words)
-            if not self._should_remove(word_labels.get(i, "O"))
-        ]
+class MultiHeadRemover(BaseModel):
+    """
+    Removes fillers and repetitions in a single forward pass.
 
-        return ' '.join(kept_words)
+    One shared encoder feeds a token-classification head per task, so the
+    encoder (~95% of the FLOPs) runs once instead of once per model. A word
+    is removed if any head labels it non-O.
 
-    def _should_remove(self, label: str) -> bool:
-        """Check if label indicates word should be removed."""
-        return "REPAIR" in label
+    Expects ml/models/multihead-remover/ to hold the shared encoder
+    (AutoModel.save_pretrained) plus heads.pt:
+        {"filler": {"weight": W, "bias": b, "id2label": {...}},
+         "repetition": {...},
+         "repair": {...}}  # optional
+
+    The heads must be trained against this shared encoder - classifier
+    layers copied from separately fine-tuned checkpoints won't match it.
+
+    Example:
+        remover = MultiHeadRemover()
+        clean = remover.process("i uh i i think")
+        # Returns: "i think"
+    """
+
+    MODEL_DIR = "multihead-remover"
+    HEADS_FILE = "heads.pt"
+
+    def __init__(self, model_path: Optional[str] = None, dtype: Optional[str] = None):
+        """
+        Initialize the model.
+
+        Args:
+            model_path: Optional custom path. If None, uses default in ml/models/
+            dtype: Weight precision (see DTYPES). If None, uses ML_DTYPE
+        """
+        if model_path:
+            self.model_path = Path(model_path)
+        else:
+            self.model_path = MODELS_BASE_PATH / self.MODEL_DIR
+
+        heads_path = self.model_path / self.HEADS_FILE
+        if not heads_path.exists():
+            raise FileNotFoundError(
+                f"Multi-head model not found at {self.model_path}. "
+                f"Train a shared-encoder checkpoint first."
+            )
+
+        self.tokenizer = load_tokenizer(self.model_path)
+        self.model = AutoModel.from_pretrained(str(self.model_path))
+        self.model.eval()
+        dtype = dtype or ML_DTYPE
+        self.model = convert_dtype(self.model, dtype)
+
+        self.heads: dict[str, torch.nn.Linear] = {}
+        self.head_labels: dict[str, dict[int, str]] = {}
+
+        for name, head in torch.load(heads_path, map_location="cpu").items():
+            out_features, in_features = head["weight"].shape
+            linear = torch.nn.Linear(in_features, out_features)
+            linear.load_state_dict({"weight": head["weight"], "bias": head["bias"]})
+            linear.eval()
+            if dtype == "bf16":
+                # Too small to be worth quantizing, but must match the encoder's output dtype
+                linear = linear.to(torch.bfloat16)
+
+            self.heads[name] = linear
+            self.head_labels[name] = {int(k): v for k, v in head["id2label"].items()}
+
+        self.id2label = {0: "O"}
+        self.is_traced = False
+
+    @property
+    def head_names(self) -> list[str]:
+        """Tasks this checkpoint has heads for (e.g. ['filler', 'repetition'])."""
+        return list(self.heads)
+
+    @classmethod
+    def is_available(cls) -> bool:
+        """Check if a shared-encoder checkpoint has been trained."""
+        return (MODELS_BASE_PATH / cls.MODEL_DIR / cls.HEADS_FILE).exists()
+
+    def _get_word_labels_batch(self, word_lists: list[list[str]]) -> list[dict[int, str]]:
+        """Run the encoder once, apply every head, and merge word labels."""
+        encoded, all_word_ids = self._encode_words(word_lists)
+        inputs = {key: torch.from_numpy(value) for key, value in encoded.items()}
+
+        with torch.inference_mode():
+            hidden = self.model(
+                input_ids=inputs["input_ids"],
+                attention_mask=inputs["attention_mask"],
+                return_dict=False
+            )[0]
+            head_predictions = {
+                name: torch.argmax(head(hidden), dim=2).numpy()
+                for name, head in self.heads.items()
+            }
+
+        batch_labels = []
+        for row in range(len(word_lists)):
+            word_ids = all_word_ids[row]
+            merged: dict[int, str] = {}
+
+            # First head to mark a word for removal wins
+            for name, predictions in head_predictions.items():
+                labels = self._labels_from_predictions(word_ids, predictions[row], self.head_labels[name])
+                for word_idx, label in labels.items():
+                    if merged.get(word_idx, "O") == "O":
+                        merged[word_idx] = label
+
+            batch_labels.append(merged)
+
+        return batch_labels
+
+
+class CoreMLFillerRemover(CoreMLBaseModel, FillerRemover):
+    """FillerRemover running on CoreML (see CoreMLBaseModel)."""
+
+    COREML_NAME = "filler_remover"
+
+
+class CoreMLRepetitionRemover(CoreMLBaseModel, RepetitionRemover):
+    """RepetitionRemover running on CoreML (see CoreMLBaseModel)."""
+
+    COREML_NAME = "repetition_remover"
+
+
+class CoreMLRepairRemover(CoreMLBaseModel, RepairRemover):
+    """RepairRemover running on CoreML (see CoreMLBaseModel)."""
+
+    COREML_NAME = "repair_remover"
+
+
+class ONNXFillerRemover(ONNXBaseModel, FillerRemover):
+    """FillerRemover running on ONNX Runtime (see ONNXBaseModel)."""
+
+    ONNX_NAME = "filler_remover"
+
+
+class ONNXRepetitionRemover(ONNXBaseModel, RepetitionRemover):
+    """RepetitionRemover running on ONNX Runtime (see ONNXBaseModel)."""
+
+    ONNX_NAME = "repetition_remover"
+
+
+class ONNXRepairRemover(ONNXBaseModel, RepairRemover):
+    """RepairRemover running on ONNX Runtime (see ONNXBaseModel)."""
+
+    ONNX_NAME = "repair_remover"
+
+
+def select_backend(pytorch_class: type, *fast_classes: type) -> Callable[..., BaseModel]:
+    """
+    Build a loader that uses the first fast backend that can run here.
+
+    fast_classes are tried in order (e.g. CoreML, then ONNX Runtime); each
+    is skipped if its runtime isn't installed or the model hasn't been
+    exported. Falls back to the PyTorch class.
+
+    With WV_ONNX_EXPORT=1, ONNX backends reached in that order are exported
+    on the spot if they haven't been yet.
+    """
+    def load(*args, **kwargs) -> BaseModel:
+        for fast_class in fast_classes:
+            if ONNX_AUTO_EXPORT and issubclass(fast_class, ONNXBaseModel):
+                fast_class.ensure_exported()
+            if fast_class.is_available():
+                return fast_class(*args, **kwargs)
+        return pytorch_class(*args, **kwargs)
+
+    load.__name__ = pytorch_class.__name__
+    load.__doc__ = pytorch_class.__doc__
+    return load
 
 
 class ListFormatter:
@@ -251,6 +1077,10 @@ class ListFormatter:
         if not text.strip():
             return text
 
+        # No list indicator - skip generation entirely
+        if not LIST_TRIGGER_RE.search(text):
+            return text
+
         # Add T5 task prefix
         input_text = "format list: " + text
 
@@ -261,8 +1091,16 @@ class ListFormatter:
             truncation=True
         )
 
-        with torch.no_grad():
-            outputs = self.model.generate(**inputs, max_length=512)
+        # Greedy decoding with the KV cache; generate() runs the encoder once
+        with torch.inference_mode():
+            outputs = self.model.generate(
+                inputs["input_ids"],
+                attention_mask=inputs["attention_mask"],
+                max_length=512,
+                num_beams=1,
+                do_sample=False,
+                use_cache=True,
+            )
 
         result = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
 
@@ -273,11 +1111,11 @@ class ListFormatter:
 
     def _fix_newlines(self, text: str) -> str:
         """Add newlines before bullet points."""
+        # Most outputs have no dashes at all - skip the regex pass
+        if '-' not in text:
+            return text
         # Pattern: space-dash-space between items should be newline-dash-space
-        import re
-        # Match " - " that's followed by a capital letter (list item) but not at start
-        result = re.sub(r'(?<!^)(\s-\s)(?=[A-Z])', r'\n- ', text)
-        return result
+        return BULLET_FIX_RE.sub('\n- ', text)
 
 
 class Truecaser:
@@ -300,9 +1138,10 @@ class Truecaser:
     """
 
     def __init__(self):
-        """Initialize the truecaser (no model path needed - uses library)."""
-        import truecase
-        self._truecase = truecase
+        """Initialize the truecaser (no model path needed - uses library).
+
+        The truecase library is imported on first use, not here.
+        """
 
     def process(self, text: str) -> str:
         """Apply truecasing to text."""
@@ -310,18 +1149,32 @@ class Truecaser:
             return text
 
         try:
-            return self._truecase.get_true_case(text)
+            # Normalize whitespace so repeats from streaming ASR hit the cache
+            return _true_case(' '.join(text.split()))
         except Exception as e:
             # If truecasing fails, return original
             print(f"[Truecaser] Error: {e}")
             return text
 
 
+@functools.lru_cache(maxsize=1)
+def _get_truecase():
+    """Import the truecase library (loads its NLTK-derived model) once."""
+    import truecase
+    return truecase
+
+
+@functools.lru_cache(maxsize=4096)
+def _true_case(text: str) -> str:
+    """Truecase text, caching results for repeated sentences."""
+    return _get_truecase().get_true_case(text)
+
+
 # Registry of available models (for easy iteration)
 AVAILABLE_MODELS = {
-    'filler': FillerRemover,
-    'repetition': RepetitionRemover,
-    'repair': RepairRemover,
+    'filler': select_backend(FillerRemover, CoreMLFillerRemover, ONNXFillerRemover),
+    'repetition': select_backend(RepetitionRemover, CoreMLRepetitionRemover, ONNXRepetitionRemover),
+    'repair': select_backend(RepairRemover, CoreMLRepairRemover, ONNXRepairRemover),
     'list': ListFormatter,
     'truecase': Truecaser,
 }
@@ -8,8 +8,9 @@ Each model only removes what it's trained for, keeping discourse
 markers like "well", "you know" intact.
 """
 
+import functools
 from typing import Optional
-from .models import FillerRemover, RepetitionRemover, RepairRemover, BaseModel
+from .models import FillerRemover, RepetitionRemover, RepairRemover, MultiHeadRemover, BaseModel
 
 
 class TranscriptPipeline:
@@ -31,14 +32,27 @@ class TranscriptPipeline:
 
     To enable repair removal:
         pipeline = TranscriptPipeline(enable_repairs=True)
+
+    process() results are cached (LRU, keyed by whitespace-normalized text)
+    because streaming ASR re-sends the same segments. add_model/insert_model
+    clear the cache; call clear_cache() after mutating .models directly.
+
+    With fuse_heads=True, when both fillers and repetitions are enabled and a
+    shared-encoder MultiHeadRemover checkpoint exists, it replaces the two
+    separate models (one forward pass instead of two). Off by default: the
+    fused heads label the original text rather than running filler removal
+    first, and process_with_details reports one step instead of two.
     """
 
+    CACHE_SIZE = 2048  # Max cached process() results
+
     def __init__(
         self,
         enable_fillers: bool = True,
         enable_repetitions: bool = True,
         enable_repairs: bool = False,  # Disabled by default - experimental
-        custom_models: Optional[list[BaseModel]] = None
+        custom_models: Optional[list[BaseModel]] = None,
+        fuse_heads: bool = False
     ):
         """
         Initialize the pipeline.
@@ -48,19 +62,33 @@ class TranscriptPipeline:
             enable_repetitions: Include repetition removal in pipeline
             enable_repairs: Include repair/self-correction removal (experimental)
             custom_models: Optional list of custom model instances to use instead
+            fuse_heads: Use MultiHeadRemover for fillers + repetitions if available
         """
         self.models: list[BaseModel] = []
 
         if custom_models:
             self.models = custom_models
         else:
-            if enable_fillers:
-                self.models.append(FillerRemover())
-            if enable_repetitions:
-                self.models.append(RepetitionRemover())
+            if fuse_heads and enable_fillers and enable_repetitions and MultiHeadRemover.is_available():
+                self.models.append(MultiHeadRemover())
+            else:
+                if enable_fillers:
+                    self.models.append(FillerRemover())
+                if enable_repetitions:
+                    self.models.append(RepetitionRemover())
             if enable_repairs:
                 self.models.append(RepairRemover())
 
+        self.clear_cache()
+
+    def clear_cache(self) -> None:
+        """Drop cached process() results (e.g. after changing the models)."""
+        self._cached_process = functools.lru_cache(maxsize=self.CACHE_SIZE)(self._process_uncached)
+
+    def cache_info(self):
+        """Hit/miss statistics for the process() cache."""
+        return self._cached_process.cache_info()
+
     def process(self, text: str) -> str:
         """
         Run text through all models in the pipeline.
@@ -71,6 +99,15 @@ class TranscriptPipeline:
         Returns:
             Cleaned text
         """
+        # Blank input (e.g. an empty ASR partial) - nothing for any model to do
+        if not text.strip() or not self.models:
+            return text
+
+        # Models re-join words with single spaces, so this doesn't change output
+        return self._cached_process(' '.join(text.split()))
+
+    def _process_uncached(self, text: str) -> str:
+        """Run text through every model (no caching)."""
         result = text
         for model in self.models:
             result = model.process(result)
@@ -108,13 +145,62 @@ class TranscriptPipeline:
             'steps': steps,
         }
 
+    def process_batch(self, texts: list[str]) -> list[str]:
+        """
+        Run several texts through the pipeline, one padded batch per model.
+
+        Args:
+            texts: Input texts to clean
+
+        Returns:
+            Cleaned texts, in the same order as the inputs
+        """
+        results = list(texts)
+        for model in self.models:
+            results = model.process_batch(results)
+        return results
+
+    def process_with_details_batch(self, texts: list[str]) -> list[dict]:
+        """
+        Batched version of process_with_details.
+
+        Args:
+            texts: Input texts to clean
+
+        Returns:
+            One dict per input with 'input', 'output', and 'steps'
+        """
+        all_steps: list[list[dict]] = [[] for _ in texts]
+        current_texts = list(texts)
+
+        for model in self.models:
+            model_name = model.__class__.__name__
+            results = model.process_with_details_batch(current_texts)
+
+            for steps, current, result in zip(all_steps, current_texts, results):
+                steps.append({
+                    'model': model_name,
+                    'input': current,
+                    'output': result['output'],
+                    'removed': result['removed'],
+                })
+
+            current_texts = [result['output'] for result in results]
+
+        return [
+            {'input': text, 'output': output, 'steps': steps}
+            for text, output, steps in zip(texts, current_texts, all_steps)
+        ]
+
     def add_model(self, model: BaseModel) -> None:
         """Add a model to the end of the pipeline."""
         self.models.append(model)
+        self.clear_cache()
 
     def insert_model(self, index: int, model: BaseModel) -> None:
         """Insert a model at a specific position in the pipeline."""
         self.models.insert(index, model)
+        self.clear_cache()
 
     @property
     def model_names(self) -> list[str]:
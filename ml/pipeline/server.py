@@ -19,12 +19,29 @@ Request body:
 
 Response:
     {"output": "cleaned transcript", "input": "original"}
+
+Concurrent POSTs to the same endpoint are coalesced into padded batches
+(up to MAX_BATCH texts, waiting at most MAX_WAIT_MS, grouped by length) so
+the models run one forward pass per length bucket instead of one per request.
 """
 
+import gzip
 import json
+import os
+import queue
 import sys
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from typing import Optional
+import threading
+import time
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Any, Callable, Optional
+
+import torch
+
+try:
+    import orjson
+except ImportError:  # Optional: falls back to the stdlib json module
+    orjson = None
 
 # Add parent directory to path for imports when run as script
 from pathlib import Path
@@ -33,52 +50,210 @@ sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 from ml.pipeline import TranscriptPipeline, FillerRemover, RepetitionRemover
 
 
-# Global pipeline instances (lazy loaded)
+# Request batching limits
+MAX_BATCH = 16
+MAX_WAIT_MS = 10
+
+# Upper bounds (in words) of the length buckets a collected batch is split
+# into, so a short text isn't padded out to a long one's length
+LENGTH_BUCKETS = (16, 32, 64, 128, 256)
+
+# Only gzip responses big enough for it to pay off (e.g. /cleanup steps)
+GZIP_MIN_BYTES = 1024
+
+
+def encode_json(data: dict) -> bytes:
+    """Serialize a response body, using orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data).encode()
+
+
+class RequestBatcher:
+    """
+    Coalesces concurrent requests into batches for a single forward pass.
+
+    Handler threads call submit() and block until their result is ready.
+    A background worker drains the queue, collecting up to max_batch texts
+    within max_wait_ms of the first one, splits them into LENGTH_BUCKETS by
+    word count, and runs each bucket through process_batch.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[list[str]], list[Any]],
+        max_batch: int = MAX_BATCH,
+        max_wait_ms: int = MAX_WAIT_MS
+    ):
+        self._process_batch = process_batch
+        self._max_batch = max_batch
+        self._max_wait = max_wait_ms / 1000
+        self._queue: queue.Queue = queue.Queue()
+
+        worker = threading.Thread(target=self._run, daemon=True)
+        worker.start()
+
+    def submit(self, text: str) -> Any:
+        """Queue text for the next batch and wait for its result."""
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    def _collect_batch(self) -> list[tuple[str, Future]]:
+        """Block for the first item, then gather more until full or timed out."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self._max_wait
+
+        while len(batch) < self._max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    @staticmethod
+    def _bucket_batch(batch: list[tuple[str, Future]]) -> list[list[tuple[str, Future]]]:
+        """
+        Group a collected batch by word count (the last bucket is open-ended).
+
+        An item that can't be measured (e.g. non-string text) fails only its
+        own future and is left out, so the worker loop keeps running.
+        """
+        buckets: dict[int, list[tuple[str, Future]]] = {}
+        for item in batch:
+            try:
+                length = len(item[0].split())
+            except Exception as e:
+                item[1].set_exception(e)
+                continue
+            bucket = next((i for i, bound in enumerate(LENGTH_BUCKETS) if length <= bound), len(LENGTH_BUCKETS))
+            buckets.setdefault(bucket, []).append(item)
+        return [buckets[key] for key in sorted(buckets)]
+
+    def _run(self):
+        """Worker loop: run each collected bucket and resolve its futures."""
+        while True:
+            for bucket in self._bucket_batch(self._collect_batch()):
+                texts = [text for text, _ in bucket]
+
+                try:
+                    results = self._process_batch(texts)
+                except Exception as e:
+                    for _, future in bucket:
+                        future.set_exception(e)
+                    continue
+
+                for (_, future), result in zip(bucket, results):
+                    future.set_result(result)
+
+
+# Global pipeline instances (loaded once by load_models)
 _full_pipeline: Optional[TranscriptPipeline] = None
 _filler_only: Optional[FillerRemover] = None
 _rep_only: Optional[RepetitionRemover] = None
 
+# Global batchers (one per endpoint)
+_cleanup_batcher: Optional[RequestBatcher] = None
+_filler_batcher: Optional[RequestBatcher] = None
+_rep_batcher: Optional[RequestBatcher] = None
+
+# Guards loading now that requests are handled on multiple threads
+_load_lock = threading.Lock()
+
+
+def load_models():
+    """
+    Load the pipeline and batchers once.
+
+    The single-model endpoints reuse the pipeline's own FillerRemover and
+    RepetitionRemover instances instead of loading second copies.
+    """
+    global _full_pipeline, _filler_only, _rep_only
+    global _cleanup_batcher, _filler_batcher, _rep_batcher
+
+    with _load_lock:
+        if _full_pipeline is not None:
+            return
 
-def get_full_pipeline() -> TranscriptPipeline:
-    """Get or create full pipeline (cached)."""
-    global _full_pipeline
-    if _full_pipeline is None:
         print("Loading full pipeline...")
-        _full_pipeline = TranscriptPipeline()
+        pipeline = TranscriptPipeline()
+
+        filler = next((m for m in pipeline.models if isinstance(m, FillerRemover)), None)
+        rep = next((m for m in pipeline.models if isinstance(m, RepetitionRemover)), None)
+        _filler_only = filler or FillerRemover()
+        _rep_only = rep or RepetitionRemover()
+
+        _cleanup_batcher = RequestBatcher(pipeline.process_with_details_batch)
+        _filler_batcher = RequestBatcher(_filler_only.process_with_details_batch)
+        _rep_batcher = RequestBatcher(_rep_only.process_with_details_batch)
+
+        _full_pipeline = pipeline
         print("Full pipeline ready")
+
+
+def get_full_pipeline() -> TranscriptPipeline:
+    """Get the full pipeline (loaded once)."""
+    load_models()
     return _full_pipeline
 
 
 def get_filler_model() -> FillerRemover:
-    """Get or create filler model (cached)."""
-    global _filler_only
-    if _filler_only is None:
-        print("Loading filler model...")
-        _filler_only = FillerRemover()
-        print("Filler model ready")
+    """Get the filler model (shared with the pipeline)."""
+    load_models()
     return _filler_only
 
 
 def get_rep_model() -> RepetitionRemover:
-    """Get or create repetition model (cached)."""
-    global _rep_only
-    if _rep_only is None:
-        print("Loading repetition model...")
-        _rep_only = RepetitionRemover()
-        print("Repetition model ready")
+    """Get the repetition model (shared with the pipeline)."""
+    load_models()
     return _rep_only
 
 
+def get_cleanup_batcher() -> RequestBatcher:
+    """Get the batcher for the full pipeline."""
+    load_models()
+    return _cleanup_batcher
+
+
+def get_filler_batcher() -> RequestBatcher:
+    """Get the batcher for the filler model."""
+    load_models()
+    return _filler_batcher
+
+
+def get_rep_batcher() -> RequestBatcher:
+    """Get the batcher for the repetition model."""
+    load_models()
+    return _rep_batcher
+
+
 class CleanupHandler(BaseHTTPRequestHandler):
     """HTTP request handler for cleanup endpoints."""
 
+    # Keep-alive: every response sends Content-Length
+    protocol_version = 'HTTP/1.1'
+
     def _send_json(self, data: dict, status: int = 200):
         """Send JSON response."""
+        payload = encode_json(data)
+
+        accepts_gzip = 'gzip' in self.headers.get('Accept-Encoding', '')
+        compressed = accepts_gzip and len(payload) >= GZIP_MIN_BYTES
+        if compressed:
+            payload = gzip.compress(payload, compresslevel=1)
+
         self.send_response(status)
         self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        if compressed:
+            self.send_header('Content-Encoding', 'gzip')
         self.send_header('Access-Control-Allow-Origin', '*')
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
+        self.wfile.write(payload)
 
     def _get_json_body(self) -> dict:
         """Parse JSON from request body."""
@@ -92,6 +267,7 @@ class CleanupHandler(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
     def do_GET(self):
@@ -118,9 +294,13 @@ class CleanupHandler(BaseHTTPRequestHandler):
                 self._send_json({'error': 'Missing "text" field'}, 400)
                 return
 
+            # Checked here: a bad value would otherwise fail every request batched with it
+            if not isinstance(text, str):
+                self._send_json({'error': '"text" must be a string'}, 400)
+                return
+
             if self.path == '/cleanup':
-                pipeline = get_full_pipeline()
-                result = pipeline.process_with_details(text)
+                result = get_cleanup_batcher().submit(text)
                 self._send_json({
                     'input': result['input'],
                     'output': result['output'],
@@ -128,8 +308,7 @@ class CleanupHandler(BaseHTTPRequestHandler):
                 })
 
             elif self.path == '/cleanup/fillers':
-                model = get_filler_model()
-                result = model.process_with_details(text)
+                result = get_filler_batcher().submit(text)
                 self._send_json({
                     'input': text,
                     'output': result['output'],
@@ -137,8 +316,7 @@ class CleanupHandler(BaseHTTPRequestHandler):
                 })
 
             elif self.path == '/cleanup/reps':
-                model = get_rep_model()
-                result = model.process_with_details(text)
+                result = get_rep_batcher().submit(text)
                 self._send_json({
                     'input': text,
                     'output': result['output'],
@@ -158,15 +336,44 @@ class CleanupHandler(BaseHTTPRequestHandler):
         print(f"[{self.log_date_time_string()}] {args[0]}")
 
 
-def run_server(host: str = '127.0.0.1', port: int = 8765):
+def configure_torch_threads(num_threads: Optional[int] = None):
+    """
+    Size PyTorch's thread pools for the batching server.
+
+    Inference runs on the batcher workers, so the inter-op pool is never
+    used; the intra-op pool defaults to half the logical cores so that
+    concurrent batches from different endpoints don't oversubscribe.
+
+    Args:
+        num_threads: Intra-op threads (default: os.cpu_count() // 2)
+    """
+    if num_threads is None:
+        num_threads = max(1, (os.cpu_count() or 2) // 2)
+
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Can only be set once, before any inter-op work has started
+        pass
+
+
+def run_server(host: str = '127.0.0.1', port: int = 8765, num_threads: Optional[int] = None):
     """
     Start the HTTP server.
 
     Args:
         host: Host to bind to (default: localhost only)
         port: Port to listen on (default: 8765)
+        num_threads: PyTorch intra-op threads (default: half the cores)
     """
-    server = HTTPServer((host, port), CleanupHandler)
+    configure_torch_threads(num_threads)
+
+    # Load up front so the first request doesn't pay for it
+    load_models()
+
+    server = ThreadingHTTPServer((host, port), CleanupHandler)
+    server.daemon_threads = True  # Don't block shutdown on in-flight requests
     print(f"ML Cleanup Server starting on http://{host}:{port}")
     print("Endpoints:")
     print("  POST /cleanup          - Full pipeline")
@@ -175,7 +382,6 @@ def run_server(host: str = '127.0.0.1', port: int = 8765):
     print("  GET  /health           - Health check")
     print("  GET  /models           - List models")
     print()
-    print("Models will be loaded on first request...")
     print("Press Ctrl+C to stop")
     print()
 
@@ -191,6 +397,8 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='ML Cleanup Server')
     parser.add_argument('--host', default='127.0.0.1', help='Host to bind to')
     parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='PyTorch intra-op threads (default: half the cores)')
     args = parser.parse_args()
 
-    run_server(args.host, args.port)
+    run_server(args.host, args.port, args.threads)
@@ -6,80 +6,352 @@ Runs Flask server on localhost:8000 that Whisper Village can call.
 Usage:
     python ml/server.py
 
+Or, for concurrent clients (see ml/wsgi.py):
+    gunicorn -k gthread --threads 32 -w 1 -b 127.0.0.1:8000 ml.wsgi:app
+
+Each forward pass uses ML_THREADS (default 2) PyTorch/OpenMP threads;
+size ML_THREADS x concurrent forwards to about the core count.
+
 Endpoints:
     POST /process - Clean up transcript text
         Body: {"text": "i uh think we should go", "models": ["filler", "list"]}
         Response: {"text": "i think we should go", "models_applied": ["filler"]}
+        With "stream": true in the body, responds with NDJSON, one line per stage
 
     GET /health - Check server status
         Response: {"status": "ok", "models_loaded": ["filler", "repetition", "repair", "list"]}
+
+Concurrent requests to the token-classifier models (filler, repetition,
+repair) are coalesced by a per-model RequestBatcher into one forward pass.
 """
 
+import atexit
+import functools
+import itertools
+import json
+import logging
+import logging.handlers
 import os
+import queue
+import re
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
+# Threads per forward pass. Several forwards run at once (one batcher per
+# model plus request threads), so each gets a small slice of the cores.
+# Must reach OpenMP/MKL before torch is first imported (in load_models).
+ML_THREADS = int(os.environ.get("ML_THREADS", "2"))
+os.environ.setdefault("OMP_NUM_THREADS", str(ML_THREADS))
+os.environ.setdefault("MKL_NUM_THREADS", str(ML_THREADS))
+
 # Add parent to path so we can import from ml.pipeline
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, stream_with_context
 from flask_cors import CORS
 
+try:
+    import orjson
+except ImportError:  # Optional: falls back to the stdlib json module
+    orjson = None
+
 app = Flask(__name__)
 CORS(app)  # Allow cross-origin requests from Swift app
 
+log = logging.getLogger("ml.server")
+_log_listener = None
+
+
+def setup_logging(level=None):
+    """
+    Route server logs through a queue to a background writer thread.
+
+    Request threads only enqueue records, so a slow (e.g. TTY) stdout never
+    serializes request handling the way per-request print() did.
+
+    Args:
+        level: Log level (default: ML_LOG_LEVEL env var, else INFO).
+            At INFO, per-request text snippets (DEBUG) are skipped.
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return
+
+    log_queue = queue.Queue(-1)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("[%(asctime)s] %(levelname)s %(message)s"))
+
+    _log_listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+
+    log.addHandler(logging.handlers.QueueHandler(log_queue))
+    log.setLevel(level or os.environ.get("ML_LOG_LEVEL", "INFO"))
+    log.propagate = False
+
 # Global model instances (loaded once at startup)
 MODELS = {}
 LOAD_ERRORS = {}
 
+# Request batchers for models that support process_batch (token classifiers)
+BATCHERS = {}
+
+# Which models to apply when the request doesn't say
+# Default: just 'filler' (safest, no false positives)
+# Repetition/repair can have false positives on list-style text
+# List formatter has issues with long context before list indicators
+DEFAULT_MODELS = ('filler',)
+
+# Define processing order (matters for quality)
+# 0. Truecasing FIRST (needs full context, proper nouns)
+# 1. Filler removal (uh, um)
+# 2. Repetition removal (i i -> i)
+# 3. Repair removal (we were i was -> i was)
+# 4. List formatting LAST (so disfluency models clean the raw text first)
+DISFLUENCY_ORDER = ('filler', 'repetition', 'repair')
+
+# Max cached /process responses
+RESPONSE_CACHE_SIZE = 8192
+
+
+def dump_json(payload):
+    """Serialize to JSON bytes, using orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload).encode()
+
+
+def json_response(payload, status=200):
+    """Build a JSON response."""
+    return app.response_class(dump_json(payload), status=status, mimetype='application/json')
+
+
+def get_json_body():
+    """Parse the request body as JSON (orjson when installed); None if invalid."""
+    body = request.get_data()
+    try:
+        return orjson.loads(body) if orjson is not None else json.loads(body)
+    except ValueError:  # orjson.JSONDecodeError is a ValueError too
+        return None
+
+
+# A run of consecutive "- " lines, and the bullet marker within a run
+BULLET_RUN_RE = re.compile(r'^- [^\n]*(?:\n- [^\n]*)*', re.MULTILINE)
+BULLET_RE = re.compile(r'^- ', re.MULTILINE)
+
 
 def convert_list_style(text, style="bullets"):
     """Convert bullet list to numbered list if requested."""
     if style != "numbered":
         return text
 
-    lines = text.split("\n")
-    result = []
-    num = 1
-    for line in lines:
-        if line.startswith("- "):
-            result.append(f"{num}. {line[2:]}")
-            num += 1
-        else:
-            result.append(line)
-            num = 1  # reset for next list
-    return "\n".join(result)
+    # No bullets at all - skip the regex pass
+    if not text.startswith("- ") and "\n- " not in text:
+        return text
+
+    def number_run(run):
+        # Numbering restarts with each run of consecutive bullet lines
+        counter = itertools.count(1)
+        return BULLET_RE.sub(lambda m: f"{next(counter)}. ", run.group())
+
+    return BULLET_RUN_RE.sub(number_run, text)
 
 
 def load_models():
-    """Load all available models at startup."""
-    from ml.pipeline.models import AVAILABLE_MODELS
+    """
+    Load all available models at startup.
+
+    Models load concurrently: from_pretrained spends most of its time in
+    file I/O and tensor deserialization, which release the GIL.
+    """
+    from ml.pipeline.models import AVAILABLE_MODELS, FUSE_HEADS, MultiHeadRemover
+    from ml.pipeline.server import RequestBatcher, configure_torch_threads
+
+    # Many request threads + batcher workers: keep torch from oversubscribing
+    configure_torch_threads(ML_THREADS)
+
+    loaders = dict(AVAILABLE_MODELS)
+
+    # Shared-encoder checkpoint: one forward pass for several disfluency tasks (opt-in)
+    if FUSE_HEADS and MultiHeadRemover.is_available():
+        loaders['multihead'] = MultiHeadRemover
 
     print("Loading ML models...")
-    for name, model_class in AVAILABLE_MODELS.items():
-        try:
-            print(f"  Loading {name}...", end=" ", flush=True)
-            MODELS[name] = model_class()
-            print("✓")
-        except FileNotFoundError as e:
-            print(f"✗ (not found)")
-            LOAD_ERRORS[name] = str(e)
-        except Exception as e:
-            print(f"✗ ({e})")
-            LOAD_ERRORS[name] = str(e)
+    with ThreadPoolExecutor(max_workers=len(loaders)) as executor:
+        futures = {executor.submit(model_class): name for name, model_class in loaders.items()}
+
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                MODELS[name] = future.result()
+                if hasattr(MODELS[name], 'process_batch'):
+                    BATCHERS[name] = RequestBatcher(MODELS[name].process_batch)
+                print(f"  {name} ✓")
+            except FileNotFoundError as e:
+                print(f"  {name} ✗ (not found)")
+                LOAD_ERRORS[name] = str(e)
+            except Exception as e:
+                print(f"  {name} ✗ ({e})")
+                LOAD_ERRORS[name] = str(e)
 
-    print(f"\nLoaded {len(MODELS)}/{len(AVAILABLE_MODELS)} models")
+    if 'multihead' in MODELS:
+        print(f"  multihead heads: {MODELS['multihead'].head_names}")
+
+    print(f"\nLoaded {len(MODELS)}/{len(loaders)} models")
     if LOAD_ERRORS:
         print(f"Failed to load: {list(LOAD_ERRORS.keys())}")
 
 
+def run_model(name, text):
+    """
+    Run text through one model.
+
+    Token classifiers go through their RequestBatcher, so concurrent requests
+    share a single padded forward pass; other models run directly.
+    """
+    if name in BATCHERS:
+        return BATCHERS[name].submit(text)
+    return MODELS[name].process(text)
+
+
+class PartialResult(Exception):
+    """Raised by process_cached when a model failed, so the result isn't cached."""
+
+    def __init__(self, result):
+        super().__init__("one or more models failed")
+        self.result = result
+
+
+def plan_stages(models_key):
+    """
+    Work out which loaded models to run, in pipeline order.
+
+    Returns:
+        List of (model to run, requested model names it covers)
+    """
+    stages = []
+
+    # Run truecasing FIRST (before removing any words, so it has full context)
+    if 'truecase' in models_key and 'truecase' in MODELS:
+        stages.append(('truecase', ('truecase',)))
+
+    # Run disfluency models on the (now properly cased) transcript.
+    # If a shared-encoder checkpoint covers exactly the requested tasks,
+    # run them as one fused forward pass instead of one encoder per task.
+    disfluency_models = [m for m in DISFLUENCY_ORDER if m in models_key]
+    fused_heads = MODELS['multihead'].head_names if 'multihead' in MODELS else []
+
+    if len(disfluency_models) > 1 and set(disfluency_models) == set(fused_heads):
+        stages.append(('multihead', tuple(disfluency_models)))
+    else:
+        stages.extend((m, (m,)) for m in disfluency_models if m in MODELS)
+
+    # Run list formatter last (it transforms structure, disfluency models would break it)
+    if 'list' in models_key and 'list' in MODELS:
+        stages.append(('list', ('list',)))
+
+    return stages
+
+
+def iter_stages(text, models_key, list_style):
+    """
+    Run text through the requested models, yielding after each stage.
+
+    Yields:
+        (stage, models covered, text after the stage, error or None).
+        A failed stage leaves the text unchanged.
+    """
+    for stage, models in plan_stages(models_key):
+        try:
+            text = run_model(stage, text)
+            if stage == 'list':
+                # Apply list style conversion (bullets or numbered)
+                text = convert_list_style(text, list_style)
+            yield stage, models, text, None
+        except Exception as e:
+            log.warning("Error in %s: %s", stage, e)
+            yield stage, models, text, str(e)
+
+
+def apply_models(text, models_key, list_style):
+    """
+    Run text through the requested models in pipeline order.
+
+    Args:
+        text: Transcript text
+        models_key: Requested model names (frozenset)
+        list_style: 'bullets' or 'numbered'
+
+    Returns:
+        (text, models_applied, failed)
+    """
+    models_applied = []
+    failed = False
+
+    for _, models, text, error in iter_stages(text, models_key, list_style):
+        if error:
+            failed = True
+        else:
+            models_applied.extend(models)
+
+    return text, models_applied, failed
+
+
+@functools.lru_cache(maxsize=RESPONSE_CACHE_SIZE)
+def process_cached(text, models_key, list_style):
+    """
+    apply_models with an LRU cache over whole responses.
+
+    Dictation re-sends the same phrases and edits, so a hit skips every
+    model. Results where a model failed raise PartialResult instead of
+    being returned, which keeps them out of the cache.
+    """
+    text, models_applied, failed = apply_models(text, models_key, list_style)
+    if failed:
+        raise PartialResult((text, tuple(models_applied)))
+    return text, tuple(models_applied)
+
+
+def stream_stages(text, models_key, list_style):
+    """
+    NDJSON body for streamed /process requests: one line per stage, then a
+    final line shaped like the regular /process response plus "done": true.
+    """
+    original = text
+    models_applied = []
+
+    for stage, models, text, error in iter_stages(text, models_key, list_style):
+        line = {'stage': stage, 'models': list(models), 'text': text}
+        if error:
+            line['error'] = error
+        else:
+            models_applied.extend(models)
+        yield dump_json(line) + b'\n'
+
+    yield dump_json({
+        'done': True,
+        'text': text,
+        'original': original,
+        'models_applied': models_applied
+    }) + b'\n'
+
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint."""
-    return jsonify({
+    cache = process_cached.cache_info()
+    lookups = cache.hits + cache.misses
+    return json_response({
         'status': 'ok',
         'models_loaded': list(MODELS.keys()),
-        'models_failed': LOAD_ERRORS
+        'models_failed': LOAD_ERRORS,
+        'cache': {
+            'hits': cache.hits,
+            'misses': cache.misses,
+            'size': cache.currsize,
+            'hit_rate': cache.hits / lookups if lookups else 0.0
+        }
     })
 
 
@@ -91,7 +363,8 @@ def process():
     Request body:
         {
             "text": "the transcript text to clean",
-            "models": ["filler", "repetition", "repair", "list"]  # optional, defaults to all
+            "models": ["filler", "repetition", "repair", "list"],  # optional, defaults to ["filler"]
+            "stream": true  # optional, see below
         }
 
     Response:
@@ -100,67 +373,56 @@ def process():
             "original": "original text",
             "models_applied": ["filler", "repetition"]
         }
-    """
-    data = request.get_json()
 
-    # Debug: log what we received
-    print(f"\n[REQUEST] models={data.get('models', 'NOT SPECIFIED')}, text={data.get('text', '')[:50]}...")
+    With "stream": true the response is NDJSON instead: a
+    {"stage", "models", "text"} line as each stage finishes (so the client
+    can show filler-cleaned text while later stages run), then a final
+    line with the fields above plus "done": true. Streamed requests bypass
+    the response cache.
+    """
+    data = get_json_body()
 
     if not data or 'text' not in data:
-        return jsonify({'error': 'Missing "text" field'}), 400
+        return json_response({'error': 'Missing "text" field'}, 400)
+    # Checked here: a bad value would otherwise fail every request batched with it
+    if not isinstance(data['text'], str):
+        return json_response({'error': '"text" must be a string'}, 400)
+
+    # models/list_style become part of process_cached's key, so they must be hashable
+    # (and a bare string would otherwise turn into a set of its characters)
+    models = data.get('models', list(DEFAULT_MODELS))
+    if not isinstance(models, list) or not all(isinstance(m, str) for m in models):
+        return json_response({'error': '"models" must be a list of strings'}, 400)
+    list_style = data.get('list_style', 'bullets')
+    if not isinstance(list_style, str):
+        return json_response({'error': '"list_style" must be a string'}, 400)
+
+    # Log what we received (text only at DEBUG)
+    log.info("/process models=%s", data.get('models', 'NOT SPECIFIED'))
+    log.debug("/process text=%.50s...", data['text'])
 
     text = data['text']
     original = text
 
-    # Which models to apply
-    # Default: just 'filler' (safest, no false positives)
-    # Repetition/repair can have false positives on list-style text
-    # List formatter has issues with long context before list indicators
-    DEFAULT_MODELS = ['filler']
-    requested_models = data.get('models', DEFAULT_MODELS)
-
-    # Define processing order (matters for quality)
-    # 0. Truecasing FIRST (needs full context, proper nouns)
-    # 1. Filler removal (uh, um)
-    # 2. Repetition removal (i i -> i)
-    # 3. Repair removal (we were i was -> i was)
-    # 4. List formatting LAST (so disfluency models clean the raw text first)
-    DISFLUENCY_ORDER = ['filler', 'repetition', 'repair']
-
-    models_applied = []
-
-    # Run truecasing FIRST (before removing any words, so it has full context)
-    if 'truecase' in requested_models and 'truecase' in MODELS:
-        try:
-            text = MODELS['truecase'].process(text)
-            models_applied.append('truecase')
-        except Exception as e:
-            print(f"Error in truecase: {e}")
+    # Which models to apply (a frozenset: O(1) membership, and hashable for
+    # process_cached - apply_models' processing order doesn't depend on request order)
+    models_key = frozenset(models)
 
-    # Run disfluency models on the (now properly cased) transcript
-    for model_name in DISFLUENCY_ORDER:
-        if model_name in requested_models and model_name in MODELS:
-            try:
-                text = MODELS[model_name].process(text)
-                models_applied.append(model_name)
-            except Exception as e:
-                print(f"Error in {model_name}: {e}")
+    if data.get('stream'):
+        return Response(
+            stream_with_context(stream_stages(text, models_key, list_style)),
+            mimetype='application/x-ndjson'
+        )
 
-    # Run list formatter last (it transforms structure, disfluency models would break it)
-    if 'list' in requested_models and 'list' in MODELS:
-        try:
-            text = MODELS['list'].process(text)
-            # Apply list style conversion (bullets or numbered)
-            list_style = data.get('list_style', 'bullets')
-            text = convert_list_style(text, list_style)
-            models_applied.append('list')
-        except Exception as e:
-            print(f"Error in list: {e}")
+    try:
+        text, models_applied = process_cached(text, models_key, list_style)
+    except PartialResult as partial:
+        text, models_applied = partial.result
 
-    return jsonify({
+    return json_response({
         'text': text,
         'original': original,
-        'models_applied': models_applied
+        'models_applied': list(models_applied)
     })
 
 
@@ -172,29 +434,32 @@ def process_single(model_name):
     Useful for testing individual models.
     """
     if model_name not in MODELS:
-        return jsonify({
+        return json_response({
             'error': f'Model "{model_name}" not loaded',
             'available': list(MODELS.keys())
-        }), 404
+        }, 404)
 
-    data = request.get_json()
+    data = get_json_body()
     if not data or 'text' not in data:
-        return jsonify({'error': 'Missing "text" field'}), 400
+        return json_response({'error': 'Missing "text" field'}, 400)
+    if not isinstance(data['text'], str):
+        return json_response({'error': '"text" must be a string'}, 400)
 
     text = data['text']
 
     try:
-        result = MODELS[model_name].process(text)
-        return jsonify({
+        result = run_model(model_name, text)
+        return json_response({
             'text': result,
             'original': text,
             'model': model_name
         })
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return json_response({'error': str(e)}, 500)
 
 
 if __name__ == '__main__':
+    setup_logging()
     load_models()
     print("\n" + "="*50)
     print("ML Server starting on http://localhost:8000")
@@ -209,4 +474,5 @@ if __name__ == '__main__':
     print('       -d \'{"text": "i uh think we should go"}\'')
     print("\nPress Ctrl+C to stop\n")
 
-    app.run(host='0.0.0.0', port=8000, debug=False)
+    # threaded so concurrent requests can meet in the batchers
+    app.run(host='0.0.0.0', port=8000, debug=False, threaded=True)
@@ -0,0 +1,243 @@
+"""
+Tests for the request batcher used by the HTTP servers.
+
+The batcher is plain Python, so these use a stub process_batch instead of
+loading any models.
+
+Run with:
+    pytest ml/tests/test_batcher.py -v
+"""
+
+import threading
+import time
+import pytest
+from concurrent.futures import Future
+from pathlib import Path
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from ml.pipeline.server import RequestBatcher, LENGTH_BUCKETS
+
+
+class StubBatch:
+    """
+    process_batch stub that records each batch it is given.
+
+    With hold=True the first call blocks until release(), so later submits
+    pile up in the queue and the next batches are collected from a full queue.
+    """
+
+    def __init__(self, hold: bool = False, fail_on: str = None):
+        self.batches: list[list[str]] = []
+        self.fail_on = fail_on
+        self._gate = threading.Event()
+        self._holding = threading.Event()
+        if not hold:
+            self._gate.set()
+
+    def __call__(self, texts: list[str]) -> list[str]:
+        self.batches.append(list(texts))
+        self._holding.set()
+        self._gate.wait()
+        if self.fail_on in texts:
+            raise ValueError(f"bad text: {self.fail_on}")
+        return [text.upper() for text in texts]
+
+    def wait_until_holding(self):
+        """Block until the worker is inside the first (held) call."""
+        assert self._holding.wait(timeout=5)
+
+    def release(self):
+        """Let the held call (and every later one) through."""
+        self._gate.set()
+
+
+def submit_in_threads(batcher: RequestBatcher, texts: list[str]) -> tuple[list[threading.Thread], dict]:
+    """Submit each text from its own thread; results (or exceptions) land in the returned dict."""
+    results = {}
+
+    def submit(text):
+        try:
+            results[text] = batcher.submit(text)
+        except Exception as e:
+            results[text] = e
+
+    threads = [threading.Thread(target=submit, args=(text,)) for text in texts]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def words(count: int) -> str:
+    """A text of exactly count words."""
+    return " ".join(["word"] * count)
+
+
+def wait_for_queue(batcher: RequestBatcher, size: int):
+    """Wait until size items are queued behind the held batch."""
+    deadline = time.monotonic() + 5
+    while batcher._queue.qsize() < size:
+        assert time.monotonic() < deadline, "submits never reached the queue"
+        time.sleep(0.01)
+
+
+class TestRequestBatcher:
+    """Test suite for RequestBatcher."""
+
+    def test_single_submit(self):
+        """Test that a lone submit gets its result."""
+        batcher = RequestBatcher(StubBatch(), max_wait_ms=1)
+        assert batcher.submit("hello") == "HELLO"
+
+    def test_concurrent_submits_get_own_results(self):
+        """Test that every concurrent caller gets the result for its own text."""
+        batcher = RequestBatcher(StubBatch(), max_batch=8, max_wait_ms=5)
+        texts = [f"text number {i}" for i in range(50)]
+
+        threads, results = submit_in_threads(batcher, texts)
+        for thread in threads:
+            thread.join(timeout=5)
+
+        assert results == {text: text.upper() for text in texts}
+
+    def test_max_batch_honored(self):
+        """Test that a full queue is drained in batches of at most max_batch."""
+        stub = StubBatch(hold=True)
+        batcher = RequestBatcher(stub, max_batch=4, max_wait_ms=200)
+
+        first, _ = submit_in_threads(batcher, ["first"])
+        stub.wait_until_holding()
+        texts = [f"queued {i}" for i in range(10)]
+        threads, results = submit_in_threads(batcher, texts)
+        wait_for_queue(batcher, len(texts))
+        stub.release()
+
+        for thread in first + threads:
+            thread.join(timeout=5)
+
+        assert [len(batch) for batch in stub.batches] == [1, 4, 4, 2]
+        assert results == {text: text.upper() for text in texts}
+
+    def test_max_wait_collects_nearby_submits(self):
+        """Test that submits arriving within max_wait_ms share a batch."""
+        stub = StubBatch()
+        batcher = RequestBatcher(stub, max_batch=16, max_wait_ms=500)
+
+        threads, results = submit_in_threads(batcher, ["one", "two"])
+        for thread in threads:
+            thread.join(timeout=5)
+
+        assert len(stub.batches) == 1
+        assert sorted(stub.batches[0]) == ["one", "two"]
+        assert results == {"one": "ONE", "two": "TWO"}
+
+    def test_max_wait_bounds_latency(self):
+        """Test that a lone submit waits out max_wait_ms, then runs alone."""
+        stub = StubBatch()
+        batcher = RequestBatcher(stub, max_batch=16, max_wait_ms=100)
+
+        start = time.monotonic()
+        assert batcher.submit("alone") == "ALONE"
+        elapsed = time.monotonic() - start
+
+        assert 0.1 <= elapsed < 2
+        assert stub.batches == [["alone"]]
+
+    def test_exception_reaches_every_future_in_bucket(self):
+        """Test that a failing batch fails all of its callers, not just one."""
+        stub = StubBatch(hold=True, fail_on="bad")
+        batcher = RequestBatcher(stub, max_batch=16, max_wait_ms=200)
+
+        first, _ = submit_in_threads(batcher, ["first"])
+        stub.wait_until_holding()
+        texts = ["good one", "bad", "good two"]
+        threads, results = submit_in_threads(batcher, texts)
+        wait_for_queue(batcher, len(texts))
+        stub.release()
+
+        for thread in first + threads:
+            thread.join(timeout=5)
+
+        assert sorted(stub.batches[1]) == sorted(texts)
+        for text in texts:
+            assert isinstance(results[text], ValueError)
+
+    def test_worker_survives_exception(self):
+        """Test that the worker keeps serving after process_batch raises."""
+        batcher = RequestBatcher(StubBatch(fail_on="bad"), max_wait_ms=1)
+
+        with pytest.raises(ValueError):
+            batcher.submit("bad")
+        assert batcher.submit("fine") == "FINE"
+
+
+class TestBucketBatch:
+    """Test suite for splitting a collected batch into length buckets."""
+
+    def bucket_sizes(self, texts: list) -> list[list[int]]:
+        """Bucket texts and return the word counts in each bucket."""
+        buckets = RequestBatcher._bucket_batch([(text, Future()) for text in texts])
+        return [[len(text.split()) for text, _ in bucket] for bucket in buckets]
+
+    def test_bucket_boundary_is_inclusive(self):
+        """Test that 16 words stays in the first bucket and 17 moves to the next."""
+        assert LENGTH_BUCKETS[0] == 16
+        assert self.bucket_sizes([words(17), words(16)]) == [[16], [17]]
+
+    def test_every_bound(self):
+        """Test that each bound and bound + 1 land in neighbouring buckets."""
+        texts = []
+        for bound in LENGTH_BUCKETS:
+            texts += [words(bound), words(bound + 1)]
+        expected = [[LENGTH_BUCKETS[0]]]
+        expected += [[low + 1, high] for low, high in zip(LENGTH_BUCKETS, LENGTH_BUCKETS[1:])]
+        expected += [[LENGTH_BUCKETS[-1] + 1]]
+        assert [sorted(sizes) for sizes in self.bucket_sizes(texts)] == expected
+
+    def test_long_texts_share_open_ended_bucket(self):
+        """Test that everything over the last bound goes into one final bucket."""
+        assert self.bucket_sizes([words(1000), words(3), words(257)]) == [[3], [1000, 257]]
+
+    def test_empty_text_in_first_bucket(self):
+        """Test that an empty text counts as zero words."""
+        assert self.bucket_sizes(["", words(20)]) == [[0], [20]]
+
+    def test_order_kept_within_bucket(self):
+        """Test that items keep their submission order inside a bucket."""
+        batch = [(f"text {i}", Future()) for i in range(5)]
+        assert RequestBatcher._bucket_batch(batch) == [batch]
+
+    def test_buckets_sorted_by_length(self):
+        """Test that buckets come back shortest first regardless of arrival order."""
+        assert self.bucket_sizes([words(300), words(100), words(40), words(2)]) == [[2], [40], [100], [300]]
+
+    def test_bad_item_fails_only_its_future(self):
+        """Test that an unmeasurable item fails its own future and is dropped."""
+        good_a, bad, good_b = (words(2), Future()), (None, Future()), (words(3), Future())
+
+        buckets = RequestBatcher._bucket_batch([good_a, bad, good_b])
+
+        assert buckets == [[good_a, good_b]]
+        assert isinstance(bad[1].exception(timeout=0), AttributeError)
+        assert not good_a[1].done() and not good_b[1].done()
+
+    def test_worker_survives_bad_item(self):
+        """Test that a non-string submit fails alone and the batcher keeps serving."""
+        stub = StubBatch(hold=True)
+        batcher = RequestBatcher(stub, max_batch=16, max_wait_ms=200)
+
+        first, _ = submit_in_threads(batcher, ["first"])
+        stub.wait_until_holding()
+        bad: Future = Future()
+        batcher._queue.put((None, bad))
+        threads, results = submit_in_threads(batcher, ["good"])
+        wait_for_queue(batcher, 2)
+        stub.release()
+
+        for thread in first + threads:
+            thread.join(timeout=5)
+
+        assert isinstance(bad.exception(timeout=5), AttributeError)
+        assert results == {"good": "GOOD"}
+        assert batcher.submit("after") == "AFTER"
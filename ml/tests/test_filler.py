@@ -12,7 +12,7 @@ from pathlib import Path
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
-from ml.pipeline.models import FillerRemover
+from ml.pipeline.models import FillerRemover, CoreMLFillerRemover
 
 
 # Load test fixtures
@@ -61,6 +61,36 @@ class TestFillerRemover:
         assert "labels" in result
         assert "uh" in result["removed"] or "um" in result["removed"]
 
+    def test_fast_path_skips_model(self, filler_model):
+        """Test that unambiguous fillers are removed without inference."""
+        hits = filler_model.fast_path_hits
+        assert filler_model.process("i uh think um we should go") == "i think we should go"
+        assert filler_model.fast_path_hits == hits + 1
+
+    def test_process_batch_matches_process(self, filler_model):
+        """Test that batched inference matches one-at-a-time inference."""
+        inputs = [case["input"] for case in FIXTURES["filler_tests"]]
+        expected = [filler_model.process(text) for text in inputs]
+        assert filler_model.process_batch(inputs) == expected
+
+    def test_int8_mostly_matches_fp32(self, filler_model):
+        """Test that int8 quantization changes few (if any) outputs."""
+        int8_model = FillerRemover(dtype="int8")
+        inputs = [case["input"] for case in FIXTURES["filler_tests"]]
+        matches = sum(int8_model.process(text) == filler_model.process(text) for text in inputs)
+        assert matches >= 0.9 * len(inputs)
+
+    def test_cached_encoding_matches_fresh(self, filler_model):
+        """Test that a cached (re-padded) encoding gives the same arrays."""
+        words = [["so", "oh", "i", "think"], ["hello"]]
+        first, first_word_ids = filler_model._encode_words(words)
+        # Copy: the returned arrays are reused buffers
+        first = {key: value.copy() for key, value in first.items()}
+        second, second_word_ids = filler_model._encode_words(words)
+        assert (first["input_ids"] == second["input_ids"]).all()
+        assert (first["attention_mask"] == second["attention_mask"]).all()
+        assert first_word_ids == second_word_ids
+
     @pytest.mark.parametrize("test_case", FIXTURES["discourse_preservation_tests"])
     def test_preserves_discourse_markers(self, filler_model, test_case):
         """Test that discourse markers are NOT removed by filler model."""
@@ -87,3 +117,14 @@ class TestFillerModelLoading:
         assert "O" in labels  # Keep label
         # Should have filler labels
         assert any("FILL" in label for label in labels)
+
+
+@pytest.mark.skipif(not CoreMLFillerRemover.is_available(), reason="CoreML export not available")
+class TestCoreMLFillerRemover:
+    """Test the CoreML runtime against the PyTorch model."""
+
+    @pytest.mark.parametrize("test_case", FIXTURES["filler_tests"])
+    def test_matches_pytorch(self, filler_model, test_case):
+        """Test that CoreML output matches PyTorch output."""
+        coreml_model = CoreMLFillerRemover()
+        assert coreml_model.process(test_case["input"]) == filler_model.process(test_case["input"])
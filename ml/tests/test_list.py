@@ -56,6 +56,11 @@ class TestListFormatter:
         assert "hello" in result.lower()
         assert "-" not in result  # No bullet points added
 
+    def test_no_list_indicator_skips_model(self, list_model):
+        """Test that text without number words/ordinals is returned as-is."""
+        input_text = "hello this is a normal sentence"
+        assert list_model.process(input_text) is input_text
+
     def test_output_has_newlines(self, list_model):
         """Test that list items are separated by newlines."""
         result = list_model.process("one apples two bananas")
@@ -154,3 +159,8 @@ class TestNewlinePostProcessing:
         result = list_model._fix_newlines(test_input)
         # Should have converted " - " to "\n- " before capital letters
         assert "Second" in result
+
+    def test_inline_dashes_exact_output(self, list_model):
+        """Test the exact newline placement, including lowercase dashes left alone."""
+        assert list_model._fix_newlines("- First - Second - third") == "- First\n- Second - third"
+        assert list_model._fix_newlines("no bullets here") == "no bullets here"
@@ -0,0 +1,115 @@
+"""
+Tests for the shared-encoder MultiHeadRemover.
+
+No trained checkpoint exists yet, so these build a tiny randomly initialised
+DistilBERT encoder plus heads.pt. Head weights are zero, so each head's
+prediction is just its bias - enough to check loading, label merging and
+pipeline wiring without a real model.
+
+Run with:
+    pytest ml/tests/test_multihead.py -v
+"""
+
+import pytest
+from pathlib import Path
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+import torch
+from transformers import DistilBertConfig, DistilBertModel, DistilBertTokenizerFast
+
+from ml.pipeline import models, TranscriptPipeline
+from ml.pipeline.models import MultiHeadRemover
+
+
+VOCAB = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "i", "uh", "think", "we", "should", "go"]
+HIDDEN_SIZE = 16
+
+FILLER_LABELS = {0: "O", 1: "B-FILL", 2: "I-FILL"}
+REPETITION_LABELS = {0: "O", 1: "B-REP", 2: "I-REP"}
+
+# Head biases: the argmax picks the label with the largest bias for every token
+KEEP = [1.0, 0.0, 0.0]
+REMOVE = [0.0, 1.0, 0.0]
+
+
+def make_checkpoint(path: Path, filler_bias: list[float], repetition_bias: list[float]) -> Path:
+    """Write a tiny shared encoder, its tokenizer and heads.pt to path."""
+    path.mkdir(parents=True)
+    (path / "vocab.txt").write_text("\n".join(VOCAB) + "\n")
+    DistilBertTokenizerFast(vocab_file=str(path / "vocab.txt")).save_pretrained(str(path))
+
+    torch.manual_seed(0)
+    config = DistilBertConfig(
+        vocab_size=len(VOCAB), dim=HIDDEN_SIZE, hidden_dim=32, n_layers=1, n_heads=2,
+        max_position_embeddings=64
+    )
+    DistilBertModel(config).save_pretrained(str(path))
+
+    torch.save({
+        "filler": {"weight": torch.zeros(3, HIDDEN_SIZE), "bias": torch.tensor(filler_bias), "id2label": FILLER_LABELS},
+        "repetition": {"weight": torch.zeros(3, HIDDEN_SIZE), "bias": torch.tensor(repetition_bias), "id2label": REPETITION_LABELS},
+    }, path / MultiHeadRemover.HEADS_FILE)
+    return path
+
+
+class TestMultiHeadRemover:
+    """Test suite for MultiHeadRemover on a tiny random checkpoint."""
+
+    def test_missing_heads_raises(self, tmp_path):
+        """Test that a directory without heads.pt is rejected."""
+        with pytest.raises(FileNotFoundError):
+            MultiHeadRemover(model_path=str(tmp_path))
+
+    def test_loads_heads(self, tmp_path):
+        """Test that every head in heads.pt is loaded with its labels."""
+        remover = MultiHeadRemover(model_path=str(make_checkpoint(tmp_path / "mh", KEEP, KEEP)))
+        assert remover.head_names == ["filler", "repetition"]
+        assert remover.head_labels["filler"] == FILLER_LABELS
+
+    def test_all_heads_keep(self, tmp_path):
+        """Test that text passes through when no head removes anything."""
+        remover = MultiHeadRemover(model_path=str(make_checkpoint(tmp_path / "mh", KEEP, KEEP)))
+        assert remover.process("i uh think we should go") == "i uh think we should go"
+
+    def test_any_head_removes(self, tmp_path):
+        """Test that a word is removed when any one head marks it."""
+        remover = MultiHeadRemover(model_path=str(make_checkpoint(tmp_path / "mh", KEEP, REMOVE)))
+        result = remover.process_with_details("i uh think")
+        assert result["output"] == ""
+        assert result["removed"] == ["i", "uh", "think"]
+        assert set(result["labels"].values()) == {"B-REP"}
+
+    def test_first_head_label_wins(self, tmp_path):
+        """Test that the first head to mark a word supplies its label."""
+        remover = MultiHeadRemover(model_path=str(make_checkpoint(tmp_path / "mh", REMOVE, REMOVE)))
+        result = remover.process_with_details("we should go")
+        assert set(result["labels"].values()) == {"B-FILL"}
+
+    def test_batch_matches_process(self, tmp_path):
+        """Test that batched processing gives the same output as one at a time."""
+        remover = MultiHeadRemover(model_path=str(make_checkpoint(tmp_path / "mh", KEEP, KEEP)))
+        texts = ["i uh think", "we should go now please", "go"]
+        assert remover.process_batch(texts) == [remover.process(t) for t in texts]
+
+
+class TestPipelineFusion:
+    """Test that the pipeline only uses fused heads when asked to."""
+
+    @pytest.fixture
+    def checkpoint_root(self, tmp_path, monkeypatch):
+        """Point MODELS_BASE_PATH at a directory holding only the multi-head checkpoint."""
+        make_checkpoint(tmp_path / MultiHeadRemover.MODEL_DIR, KEEP, KEEP)
+        monkeypatch.setattr(models, "MODELS_BASE_PATH", tmp_path)
+        return tmp_path
+
+    def test_fuse_heads_uses_multihead(self, checkpoint_root):
+        """Test that fuse_heads=True replaces filler + repetition with one model."""
+        pipeline = TranscriptPipeline(fuse_heads=True)
+        assert [type(m) for m in pipeline.models] == [MultiHeadRemover]
+
+    def test_fusion_off_by_default(self, checkpoint_root):
+        """Test that the default pipeline ignores the checkpoint (and needs the separate models)."""
+        with pytest.raises(FileNotFoundError):
+            TranscriptPipeline()
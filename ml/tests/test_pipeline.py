@@ -75,6 +75,25 @@ class TestTranscriptPipeline:
             assert "output" in step
             assert "removed" in step
 
+    def test_process_cached(self, pipeline):
+        """Test that repeated text is served from the cache."""
+        first = pipeline.process("so uh we we should go")
+        hits = pipeline.cache_info().hits
+        assert pipeline.process("so  uh we we should go ") == first
+        assert pipeline.cache_info().hits == hits + 1
+
+    def test_process_batch(self, pipeline):
+        """Test that batched processing matches per-text processing."""
+        inputs = [case["input"] for case in FIXTURES["pipeline_tests"]] + [""]
+        expected = [pipeline.process(text) for text in inputs]
+        assert pipeline.process_batch(inputs) == expected
+
+    def test_process_with_details_batch(self, pipeline):
+        """Test that batched details match per-text details."""
+        inputs = ["i uh i i think", "um we we should go"]
+        expected = [pipeline.process_with_details(text) for text in inputs]
+        assert pipeline.process_with_details_batch(inputs) == expected
+
     @pytest.mark.parametrize("test_case", FIXTURES["discourse_preservation_tests"])
     def test_preserves_discourse_markers(self, pipeline, test_case):
         """Test that discourse markers survive the full pipeline."""
@@ -86,6 +105,11 @@ class TestTranscriptPipeline:
 class TestPipelineConfiguration:
     """Test pipeline configuration options."""
 
+    def test_models_share_tokenizer(self, pipeline):
+        """Test that models fine-tuned from the same base share one tokenizer."""
+        filler, repetition = pipeline.models
+        assert filler.tokenizer is repetition.tokenizer
+
     def test_filler_only_pipeline(self):
         """Test pipeline with only filler removal."""
         pipeline = TranscriptPipeline(enable_fillers=True, enable_repetitions=False)
@@ -130,8 +154,10 @@ class TestPipelineConfiguration:
         pipeline = TranscriptPipeline(enable_fillers=True, enable_repetitions=False)
         assert len(pipeline.models) == 1
 
+        pipeline.process("i uh i i think")
         pipeline.add_model(RepetitionRemover())
         assert len(pipeline.models) == 2
+        assert pipeline.cache_info().currsize == 0
 
     def test_insert_model(self):
         """Test inserting model at specific position."""
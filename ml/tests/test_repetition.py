@@ -47,6 +47,12 @@ class TestRepetitionRemover:
         assert "this" in result
         assert "sentence" in result
 
+    def test_no_repetitions_skips_model(self, rep_model):
+        """Test that text without repeated words skips inference."""
+        hits = rep_model.fast_path_hits
+        assert rep_model.process("this is a normal sentence") == "this is a normal sentence"
+        assert rep_model.fast_path_hits == hits + 1
+
     def test_triple_repetition(self, rep_model):
         """Test handling of triple repetition."""
         result = rep_model.process("i i i think")
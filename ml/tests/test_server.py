@@ -0,0 +1,196 @@
+"""
+Tests for the Flask server's /process endpoint.
+
+Models are replaced with stubs, so these exercise request handling, the
+response cache and stage ordering without loading any weights.
+
+Run with:
+    pytest ml/tests/test_server.py -v
+"""
+
+import json
+import pytest
+from pathlib import Path
+
+import sys
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from ml import server
+
+
+class StubModel:
+    """Stand-in model that counts calls and applies a plain function."""
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.calls = 0
+
+    def process(self, text: str) -> str:
+        self.calls += 1
+        return self.fn(text)
+
+
+def remove_fillers(text: str) -> str:
+    return " ".join(w for w in text.split() if w not in ("uh", "um"))
+
+
+def remove_repetitions(text: str) -> str:
+    words = text.split()
+    return " ".join(w for i, w in enumerate(words) if i == 0 or w != words[i - 1])
+
+
+def fail(text: str) -> str:
+    raise RuntimeError("model exploded")
+
+
+@pytest.fixture
+def stub_models(monkeypatch):
+    """Swap in stub filler/repetition models and start from an empty cache."""
+    stubs = {
+        'filler': StubModel(remove_fillers),
+        'repetition': StubModel(remove_repetitions),
+    }
+    monkeypatch.setattr(server, "MODELS", dict(stubs))
+    monkeypatch.setattr(server, "BATCHERS", {})
+    server.process_cached.cache_clear()
+    yield stubs
+    server.process_cached.cache_clear()
+
+
+@pytest.fixture
+def client(stub_models):
+    """Flask test client backed by the stub models."""
+    return server.app.test_client()
+
+
+def post(client, text, models, **extra):
+    """POST /process and return the response."""
+    return client.post('/process', json={'text': text, 'models': models, **extra})
+
+
+def stream(client, text, models):
+    """POST a streamed /process and return (response, parsed NDJSON lines)."""
+    response = post(client, text, models, stream=True)
+    return response, [json.loads(line) for line in response.data.splitlines()]
+
+
+class TestResponseCache:
+    """Test suite for the process_cached response cache."""
+
+    def test_repeat_request_hits_cache(self, client, stub_models):
+        """Test that a repeated request is answered without running the models."""
+        first = post(client, "i uh think we we should go", ['filler', 'repetition'])
+        second = post(client, "i uh think we we should go", ['filler', 'repetition'])
+
+        assert first.get_json() == second.get_json() == {
+            'text': "i think we should go",
+            'original': "i uh think we we should go",
+            'models_applied': ['filler', 'repetition']
+        }
+        assert stub_models['filler'].calls == 1
+        assert stub_models['repetition'].calls == 1
+        assert server.process_cached.cache_info().hits == 1
+
+    def test_model_order_shares_entry(self, client, stub_models):
+        """Test that the same models in a different request order hit the same entry."""
+        post(client, "uh go go", ['filler', 'repetition'])
+        response = post(client, "uh go go", ['repetition', 'filler'])
+
+        assert response.get_json()['models_applied'] == ['filler', 'repetition']
+        assert stub_models['filler'].calls == 1
+
+    def test_key_includes_models_and_list_style(self, client, stub_models):
+        """Test that changing models or list_style misses the cache."""
+        post(client, "uh go", ['filler'])
+        post(client, "uh go", ['filler', 'repetition'])
+        post(client, "uh go", ['filler'], list_style='numbered')
+
+        cache = server.process_cached.cache_info()
+        assert (cache.hits, cache.misses, cache.currsize) == (0, 3, 3)
+        assert stub_models['filler'].calls == 3
+
+    def test_partial_result_not_cached(self, client, stub_models, monkeypatch):
+        """Test that a response with a failed model is returned but never cached."""
+        monkeypatch.setitem(server.MODELS, 'repetition', StubModel(fail))
+
+        responses = [post(client, "uh go go", ['filler', 'repetition']) for _ in range(2)]
+
+        for response in responses:
+            assert response.status_code == 200
+            assert response.get_json() == {
+                'text': "go go",
+                'original': "uh go go",
+                'models_applied': ['filler']
+            }
+        assert stub_models['filler'].calls == 2
+        assert server.process_cached.cache_info().currsize == 0
+
+    def test_health_reports_cache_stats(self, client):
+        """Test that /health exposes hits, misses, size and hit rate."""
+        assert client.get('/health').get_json()['cache'] == {
+            'hits': 0, 'misses': 0, 'size': 0, 'hit_rate': 0.0
+        }
+
+        post(client, "uh go", ['filler'])
+        post(client, "uh go", ['filler'])
+
+        health = client.get('/health').get_json()
+        assert health['cache'] == {'hits': 1, 'misses': 1, 'size': 1, 'hit_rate': 0.5}
+        assert sorted(health['models_loaded']) == ['filler', 'repetition']
+
+
+class TestStreaming:
+    """Test suite for NDJSON streaming from /process."""
+
+    def test_one_line_per_stage(self, client):
+        """Test that each stage emits a line in pipeline order, then a final line."""
+        response, lines = stream(client, "i uh think we we should go", ['repetition', 'filler'])
+
+        assert response.mimetype == 'application/x-ndjson'
+        assert lines[:-1] == [
+            {'stage': 'filler', 'models': ['filler'], 'text': "i think we we should go"},
+            {'stage': 'repetition', 'models': ['repetition'], 'text': "i think we should go"},
+        ]
+        assert lines[-1]['done'] is True
+
+    def test_final_line_matches_regular_response(self, client):
+        """Test that the final line is the non-streamed response plus "done"."""
+        text, models = "uh we we go", ['filler', 'repetition']
+
+        _, lines = stream(client, text, models)
+        regular = post(client, text, models).get_json()
+
+        final = dict(lines[-1])
+        assert final.pop('done') is True
+        assert final == regular
+
+    def test_stage_error_keeps_streaming(self, client, monkeypatch):
+        """Test that a failing stage reports its error and later stages still run."""
+        monkeypatch.setitem(server.MODELS, 'filler', StubModel(fail))
+
+        response, lines = stream(client, "uh we we go", ['filler', 'repetition'])
+
+        assert response.status_code == 200
+        assert lines[0] == {
+            'stage': 'filler', 'models': ['filler'], 'text': "uh we we go", 'error': "model exploded"
+        }
+        assert lines[1] == {'stage': 'repetition', 'models': ['repetition'], 'text': "uh we go"}
+        assert lines[2] == {
+            'done': True, 'text': "uh we go", 'original': "uh we we go", 'models_applied': ['repetition']
+        }
+
+    def test_unloaded_models_skipped(self, client):
+        """Test that requested models that aren't loaded produce no stage lines."""
+        _, lines = stream(client, "uh go", ['filler', 'repair', 'list'])
+
+        assert [line.get('stage') for line in lines] == ['filler', None]
+        assert lines[-1]['models_applied'] == ['filler']
+
+    def test_stream_bypasses_cache(self, client, stub_models):
+        """Test that streamed requests neither read nor fill the response cache."""
+        stream(client, "uh go", ['filler'])
+        stream(client, "uh go", ['filler'])
+
+        cache = server.process_cached.cache_info()
+        assert (cache.hits, cache.misses, cache.currsize) == (0, 0, 0)
+        assert stub_models['filler'].calls == 2
@@ -0,0 +1,126 @@
+"""
+Helpers shared by the training scripts.
+
+The scripts run from this directory (python ml/training/train_*.py), so they
+import these as `from common import ...`.
+"""
+
+import ast
+import json
+import re
+
+import pyarrow as pa
+from pyarrow import csv as pa_csv
+from transformers import TrainerCallback
+
+# ============================================================================
+# Best-Model Tracking
+# ============================================================================
+
+class KeepBestModelCallback(TrainerCallback):
+    """Keep the best-scoring weights in memory instead of checkpointing every epoch."""
+
+    def __init__(self, metric):
+        self.metric = f"eval_{metric}"
+        self.best_score = None
+        self.best_state = None
+
+    def on_evaluate(self, args, state, control, metrics=None, model=None, **kwargs):
+        score = (metrics or {}).get(self.metric)
+        if score is not None and (self.best_score is None or score > self.best_score):
+            self.best_score = score
+            self.best_state = {k: v.detach().to("cpu", copy=True) for k, v in model.state_dict().items()}
+
+    def restore(self, model):
+        """Load the best weights seen so far back into model."""
+        if self.best_state is not None:
+            model.load_state_dict(self.best_state)
+
+# ============================================================================
+# DisfluencySpeech Markup
+# ============================================================================
+
+# Non-speech markers like <laughter>
+NON_SPEECH_RE = re.compile(r'<[^>]+>')
+
+# One pass over DisfluencySpeech markup: at each position the alternatives are
+# tried in order ({F}, {D}, {C}, [repair + ...], word), like the old
+# per-character re.match loop, but without slicing text[i:] every step
+MARKUP_TOKEN_RE = re.compile(
+    r"(?P<F>\{F\s+(?P<f>[^}]+)\})"
+    r"|(?P<D>\{D\s+(?P<d>[^}]+)\})"
+    r"|(?P<C>\{C\s+(?P<c>[^}]+)\})"
+    r"|(?P<REPAIR>\[\s*(?P<before>[^+\]]*)\+\s*(?P<after>[^\]]*)\])"
+    r"|(?P<WORD>[\w']+)"
+)
+
+
+def iter_markup_tokens(annotated):
+    """Yield MARKUP_TOKEN_RE matches over an annotated transcript (match.lastgroup is the kind)."""
+    text = NON_SPEECH_RE.sub('', annotated)
+    # Commas carry no meaning for the markup; blank them once, not per group
+    # (a space, so bare "a,b" still splits into two words as before)
+    text = text.replace(',', ' ')
+    return MARKUP_TOKEN_RE.finditer(text)
+
+# ============================================================================
+# Switchboard TSV
+# ============================================================================
+
+def parse_list_literal(value):
+    """
+    Parse a Python list-of-strings repr as stored in the Switchboard TSV.
+
+    With no double quotes or backslashes, every element is a plain single-quoted
+    string, so swapping quote characters yields equivalent JSON and the C json
+    parser can read it. Anything else (e.g. "don't") goes through ast.literal_eval.
+    """
+    if '"' not in value and '\\' not in value:
+        try:
+            return json.loads(value.replace("'", '"'))
+        except json.JSONDecodeError:
+            pass
+    return ast.literal_eval(value)
+
+
+def read_switchboard_columns(filepath):
+    """
+    Read the sentence/ms_disfl columns with pyarrow's multithreaded CSV reader.
+
+    Returns (sentences, disfl_tags, malformed). Rows with the wrong number of
+    fields are skipped and counted rather than failing the whole read.
+    """
+    malformed = []
+    table = pa_csv.read_csv(
+        filepath,
+        parse_options=pa_csv.ParseOptions(
+            delimiter='\t',
+            invalid_row_handler=lambda row: malformed.append(row.number) or 'skip'
+        ),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=['sentence', 'ms_disfl'],
+            column_types={'sentence': pa.string(), 'ms_disfl': pa.string()}
+        )
+    )
+    return table['sentence'].to_pylist(), table['ms_disfl'].to_pylist(), len(malformed)
+
+
+def parse_switchboard_row(sentence_str, disfl_str):
+    """
+    Parse one row's sentence and ms_disfl list strings.
+
+    Returns (words, tags), or None if either doesn't parse or their lengths differ.
+    """
+    try:
+        words = parse_list_literal(sentence_str)
+        # Tags never contain commas, so counting them gives the tag count:
+        # skip length mismatches before paying to parse the tags
+        if words and disfl_str.count(',') != len(words) - 1:
+            return None
+        tags = parse_list_literal(disfl_str)
+    except (ValueError, SyntaxError):
+        return None
+
+    if len(words) != len(tags):
+        return None
+    return words, tags
@@ -9,9 +9,12 @@ Example:
 """
 
 import json
-import random
+import operator
+import string
 from pathlib import Path
 
+import numpy as np
+
 # Number words for lists
 NUMBERS = ["one", "two", "three", "four", "five"]
 ORDINALS = ["first", "second", "third", "fourth", "fifth"]
@@ -108,93 +111,109 @@ VERBS = [
 # Optional filler words to inject for realism
 FILLERS = ["um", "uh", "like", "you know"]
 
+# Regular sentences without numbers (negative examples)
+NEGATIVE_TEMPLATES = [
+    "I think we should {verb} the {noun} tomorrow",
+    "the {noun} looks good to me",
+    "can you {verb} the {noun} when you get a chance",
+    "I spoke with {person} about the {noun}",
+    "the meeting with {person} went well",
+    "I'm working on the {noun} right now",
+    "let me know when the {noun} is ready",
+]
 
-def generate_list_item():
-    """Generate a random list item."""
-    template = random.choice(TASK_TEMPLATES)
-    item = template.format(
-        noun=random.choice(NOUNS),
-        person=random.choice(PERSONS),
-        verb=random.choice(VERBS),
-    )
-    return item
-
-
-def generate_example(use_ordinals=False, num_items=None, add_fillers=False, include_intro=True):
-    """Generate a single training example."""
-    if num_items is None:
-        num_items = random.randint(2, 5)
-
+# Most items in one example (len(NUMBERS) / len(ORDINALS))
+MAX_ITEMS = 5
+
+TEMPLATE_FIELDS = ("noun", "person", "verb")
+
+
+def compile_template(template):
+    """
+    Compile a template into a function of (noun, person, verb).
+
+    The template is parsed once with string.Formatter into a %-format string
+    plus the order of its fields, so building a string skips str.format's
+    per-call parsing.
+    """
+    fmt_parts = []
+    field_order = []
+    for literal, name, spec, conversion in string.Formatter().parse(template):
+        fmt_parts.append(literal.replace("%", "%%"))
+        if name is None:
+            continue
+        if name not in TEMPLATE_FIELDS or spec or conversion:
+            raise ValueError(f"Unsupported template field {name!r} in {template!r}")
+        fmt_parts.append("%s")
+        field_order.append(TEMPLATE_FIELDS.index(name))
+    fmt = "".join(fmt_parts)
+
+    # itemgetter returns a tuple only for 2+ fields, so the smaller cases are spelled out
+    if len(field_order) > 1:
+        pick = operator.itemgetter(*field_order)
+        return lambda *values: fmt % pick(values)
+    if field_order:
+        index = field_order[0]
+        return lambda *values: fmt % (values[index],)
+    return lambda *values: fmt % ()
+
+
+COMPILED_TASK_TEMPLATES = [compile_template(t) for t in TASK_TEMPLATES]
+COMPILED_NEGATIVE_TEMPLATES = [compile_template(t) for t in NEGATIVE_TEMPLATES]
+
+
+def generate_list_item(template_idx, noun_idx, person_idx, verb_idx):
+    """Build a list item from pre-drawn template/word indices."""
+    return COMPILED_TASK_TEMPLATES[template_idx](NOUNS[noun_idx], PERSONS[person_idx], VERBS[verb_idx])
+
+
+def generate_example(items, use_ordinals=False, intro=None, fillers=None):
+    """
+    Build a single training example from already-sampled parts.
+
+    Args:
+        items: List item texts, in order
+        use_ordinals: "first X second Y" instead of "one X two Y"
+        intro: Intro phrase to put before the list, or None
+        fillers: Per item, a filler to say before its number (or None)
+    """
     numbers = ORDINALS if use_ordinals else NUMBERS
-
-    # Generate list items
-    items = [generate_list_item() for _ in range(num_items)]
+    has_intro = intro is not None
 
     # Build input text
     input_parts = []
 
     # Optional intro
-    if include_intro and random.random() > 0.2:
-        intro = random.choice(INTRO_PHRASES)
+    if has_intro:
         input_parts.append(intro)
 
     # Add numbered items
     for i, item in enumerate(items):
         # Maybe add filler before number
-        if add_fillers and random.random() > 0.7:
-            input_parts.append(random.choice(FILLERS))
+        if fillers and fillers[i] is not None:
+            input_parts.append(fillers[i])
 
         input_parts.append(numbers[i])
         input_parts.append(item)
 
     input_text = " ".join(input_parts)
 
-    # Build output text
-    output_parts = []
-
-    # Keep intro if present
-    if include_intro and input_parts and input_parts[0] in INTRO_PHRASES:
-        output_parts.append(input_parts[0])
-
-    # Add bullet points
-    for item in items:
-        # Capitalize first letter
-        formatted_item = item[0].upper() + item[1:] if item else item
-        output_parts.append(f"- {formatted_item}")
-
-    if output_parts and output_parts[0] not in [f"- {item[0].upper() + item[1:]}" for item in items]:
-        # Has intro
-        output_text = output_parts[0] + "\n" + "\n".join(output_parts[1:])
-    else:
-        output_text = "\n".join(output_parts)
+    # Build output text: intro (if present) then one capitalized bullet per item
+    output_parts = [intro] if has_intro else []
+    output_parts.extend([f"- {item[:1].upper()}{item[1:]}" for item in items])
+    output_text = "\n".join(output_parts)
 
     return {
         "input": input_text,
         "output": output_text,
-        "num_items": num_items,
+        "num_items": len(items),
         "style": "ordinal" if use_ordinals else "number",
     }
 
 
-def generate_negative_example():
-    """Generate an example WITHOUT list indicators (should pass through unchanged)."""
-    # Regular sentence without numbers
-    templates = [
-        "I think we should {verb} the {noun} tomorrow",
-        "the {noun} looks good to me",
-        "can you {verb} the {noun} when you get a chance",
-        "I spoke with {person} about the {noun}",
-        "the meeting with {person} went well",
-        "I'm working on the {noun} right now",
-        "let me know when the {noun} is ready",
-    ]
-
-    template = random.choice(templates)
-    text = template.format(
-        noun=random.choice(NOUNS),
-        person=random.choice(PERSONS),
-        verb=random.choice(VERBS),
-    )
+def generate_negative_example(template_idx, noun_idx, person_idx, verb_idx):
+    """Build an example WITHOUT list indicators (should pass through unchanged)."""
+    text = COMPILED_NEGATIVE_TEMPLATES[template_idx](NOUNS[noun_idx], PERSONS[person_idx], VERBS[verb_idx])
 
     return {
         "input": text,
@@ -204,34 +223,68 @@ def generate_negative_example():
     }
 
 
-def generate_dataset(n_examples=1500, negative_ratio=0.15):
-    """Generate full dataset with positive and negative examples."""
-    examples = []
+def generate_dataset(n_examples=1500, negative_ratio=0.15, seed=42):
+    """
+    Generate full dataset with positive and negative examples.
+
+    All random choices are drawn up front as numpy arrays (a handful of
+    C-level calls instead of dozens of random.choice calls per example);
+    the loops below only index into them.
+    """
+    rng = np.random.default_rng(seed)
 
     n_negative = int(n_examples * negative_ratio)
     n_positive = n_examples - n_negative
+    item_shape = (n_positive, MAX_ITEMS)
+
+    # Positive example draws (.tolist() so the loops index plain Python lists)
+    use_ordinals = (rng.random(n_positive) > 0.5).tolist()
+    add_fillers = (rng.random(n_positive) > 0.7).tolist()  # 30% have fillers
+    has_intro = ((rng.random(n_positive) > 0.2) & (rng.random(n_positive) > 0.2)).tolist()  # ~64% keep an intro
+    num_items = rng.integers(2, MAX_ITEMS + 1, size=n_positive).tolist()
+    intro_idx = rng.integers(0, len(INTRO_PHRASES), size=n_positive).tolist()
+    template_idx = rng.integers(0, len(TASK_TEMPLATES), size=item_shape).tolist()
+    noun_idx = rng.integers(0, len(NOUNS), size=item_shape).tolist()
+    person_idx = rng.integers(0, len(PERSONS), size=item_shape).tolist()
+    verb_idx = rng.integers(0, len(VERBS), size=item_shape).tolist()
+    filler_gate = (rng.random(item_shape) > 0.7).tolist()
+    filler_idx = rng.integers(0, len(FILLERS), size=item_shape).tolist()
+
+    # Sizes are known up front: positives fill [0, n_positive), negatives the rest
+    examples = [None] * n_examples
 
     # Generate positive examples with variety
     for i in range(n_positive):
-        use_ordinals = random.random() > 0.5
-        add_fillers = random.random() > 0.7  # 30% have fillers
-        include_intro = random.random() > 0.2  # 80% have intro
-
-        example = generate_example(
-            use_ordinals=use_ordinals,
-            add_fillers=add_fillers,
-            include_intro=include_intro,
+        items = [
+            generate_list_item(template_idx[i][j], noun_idx[i][j], person_idx[i][j], verb_idx[i][j])
+            for j in range(num_items[i])
+        ]
+        fillers = None
+        if add_fillers[i]:
+            fillers = [
+                FILLERS[filler_idx[i][j]] if filler_gate[i][j] else None
+                for j in range(num_items[i])
+            ]
+
+        examples[i] = generate_example(
+            items,
+            use_ordinals=use_ordinals[i],
+            intro=INTRO_PHRASES[intro_idx[i]] if has_intro[i] else None,
+            fillers=fillers,
         )
-        examples.append(example)
 
     # Generate negative examples (no list formatting needed)
-    for i in range(n_negative):
-        examples.append(generate_negative_example())
+    negative_draws = zip(
+        rng.integers(0, len(NEGATIVE_TEMPLATES), size=n_negative).tolist(),
+        rng.integers(0, len(NOUNS), size=n_negative).tolist(),
+        rng.integers(0, len(PERSONS), size=n_negative).tolist(),
+        rng.integers(0, len(VERBS), size=n_negative).tolist(),
+    )
+    for i, draw in enumerate(negative_draws, start=n_positive):
+        examples[i] = generate_negative_example(*draw)
 
     # Shuffle
-    random.shuffle(examples)
-
-    return examples
+    return [examples[i] for i in rng.permutation(len(examples)).tolist()]
 
 
 def split_dataset(examples, train_ratio=0.8, val_ratio=0.1):
@@ -248,12 +301,10 @@ def split_dataset(examples, train_ratio=0.8, val_ratio=0.1):
 
 
 def main():
-    random.seed(42)
-
     print("Generating synthetic list formatting dataset...")
 
     # Generate examples
-    examples = generate_dataset(n_examples=1500)
+    examples = generate_dataset(n_examples=1500, seed=42)
 
     print(f"Generated {len(examples)} total examples")
 
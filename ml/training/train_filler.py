@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 """
 FILLER REMOVER MODEL - Google Colab Version
-Copy this entire script into a Colab notebook cell and run it.
+Upload common.py (from this directory) to the Colab working directory, then
+copy this entire script into a notebook cell and run it.
 
 Trains a DistilBERT model to remove fillers ("uh", "um", "er", etc.)
 Uses only {F ...} tags from DisfluencySpeech dataset.
@@ -12,9 +13,10 @@ Uses only {F ...} tags from DisfluencySpeech dataset.
 # ============================================================================
 # !pip install transformers datasets evaluate seqeval accelerate -q
 
-import re
+import os
 import numpy as np
-from datasets import load_dataset, Dataset
+import torch
+from datasets import load_dataset, ClassLabel, Features, Sequence, Value
 from transformers import (
     AutoTokenizer,
     AutoModelForTokenClassification,
@@ -24,6 +26,8 @@ from transformers import (
 )
 import evaluate
 
+from common import KeepBestModelCallback, iter_markup_tokens
+
 # ============================================================================
 # Configuration
 # ============================================================================
@@ -31,91 +35,92 @@ import evaluate
 MODEL_NAME = "distilbert-base-uncased"
 OUTPUT_DIR = "./filler-remover-model"
 NUM_EPOCHS = 3
-BATCH_SIZE = 16
+BATCH_SIZE = 64
+EVAL_BATCH_SIZE = 128
+GRADIENT_ACCUMULATION_STEPS = 1  # Raise if BATCH_SIZE doesn't fit in GPU memory
 LEARNING_RATE = 2e-5
+NUM_PROC = os.cpu_count() or 1  # Processes for dataset parsing/tokenization
+DATALOADER_WORKERS = 4
+
+# Mixed precision on GPU: bf16 (plus TF32 matmuls) on Ampere+, else fp16
+USE_BF16 = torch.cuda.is_available() and torch.cuda.is_bf16_supported()
+USE_FP16 = torch.cuda.is_available() and not USE_BF16
 
 # Simple labels: O (keep) or FILL (remove)
 LABEL_LIST = ["O", "B-FILL", "I-FILL"]
 LABEL2ID = {label: i for i, label in enumerate(LABEL_LIST)}
 ID2LABEL = {i: label for i, label in enumerate(LABEL_LIST)}
 
+# Integer ids, so the parser emits model labels directly
+O_ID = LABEL2ID["O"]
+B_FILL_ID = LABEL2ID["B-FILL"]
+I_FILL_ID = LABEL2ID["I-FILL"]
+
+# Explicit Arrow schema, so datasets never has to infer one
+FEATURES = Features({
+    "tokens": Sequence(Value("string")),
+    "ner_tags": Sequence(ClassLabel(names=LABEL_LIST)),
+})
+
 # ============================================================================
 # Parse DisfluencySpeech - FILLERS ONLY
 # ============================================================================
 
 def parse_fillers_only(annotated):
-    """Parse annotated transcript - only extract fillers, ignore everything else."""
+    """Parse annotated transcript - only extract fillers, ignore everything else.
+
+    Returns (tokens, tag ids) with tags as LABEL2ID integers.
+    """
     tokens = []
     tags = []
 
-    # Remove non-speech markers like <laughter>
-    text = re.sub(r'<[^>]+>', '', annotated)
+    for match in iter_markup_tokens(annotated):
+        kind = match.lastgroup
 
-    i = 0
-    while i < len(text):
-        # Check for filler {F ... } - REMOVE THESE
-        filler_match = re.match(r'\{F\s+([^}]+)\}', text[i:])
-        if filler_match:
-            content = filler_match.group(1).strip()
-            words = content.replace(',', '').split()
+        if kind == 'F':
+            # Filler {F ... } - REMOVE THESE
+            content = match.group('f').strip()
+            words = content.split()
             for j, word in enumerate(words):
                 if word:
                     tokens.append(word.lower())
-                    tags.append('B-FILL' if j == 0 else 'I-FILL')
-            i += filler_match.end()
-            continue
-
-        # Check for discourse marker {D ... } - KEEP (not removing discourse)
-        disc_match = re.match(r'\{D\s+([^}]+)\}', text[i:])
-        if disc_match:
-            content = disc_match.group(1).strip()
-            words = content.replace(',', '').split()
+                    tags.append(B_FILL_ID if j == 0 else I_FILL_ID)
+
+        elif kind == 'D':
+            # Discourse marker {D ... } - KEEP (not removing discourse)
+            content = match.group('d').strip()
+            words = content.split()
             for word in words:
                 if word:
                     tokens.append(word.lower())
-                    tags.append('O')  # Keep discourse markers
-            i += disc_match.end()
-            continue
-
-        # Check for conjunction {C ... } - KEEP
-        conj_match = re.match(r'\{C\s+([^}]+)\}', text[i:])
-        if conj_match:
-            content = conj_match.group(1).strip()
-            words = content.replace(',', '').split()
+                    tags.append(O_ID)  # Keep discourse markers
+
+        elif kind == 'C':
+            # Conjunction {C ... } - KEEP
+            content = match.group('c').strip()
+            words = content.split()
             for word in words:
                 if word:
                     tokens.append(word.lower())
-                    tags.append('O')
-            i += conj_match.end()
-            continue
+                    tags.append(O_ID)
 
-        # Check for repair [ ... + ... ] - KEEP ALL (not handling repairs here)
-        repair_match = re.match(r'\[\s*([^+\]]*)\+\s*([^\]]*)\]', text[i:])
-        if repair_match:
-            before = repair_match.group(1).strip()
-            after = repair_match.group(2).strip()
+        elif kind == 'REPAIR':
+            # Repair [ ... + ... ] - KEEP ALL (not handling repairs here)
+            before = match.group('before').strip()
+            after = match.group('after').strip()
 
             # Keep both parts for this model (repairs handled separately)
             for part in [before, after]:
-                words = part.replace(',', '').split()
+                words = part.split()
                 for word in words:
                     if word and not word.startswith('-'):
                         tokens.append(word.lower())
-                        tags.append('O')
+                        tags.append(O_ID)
 
-            i += repair_match.end()
-            continue
-
-        # Regular word - KEEP
-        word_match = re.match(r"[\w']+", text[i:])
-        if word_match:
-            word = word_match.group(0)
-            tokens.append(word.lower())
-            tags.append('O')
-            i += word_match.end()
-            continue
-
-        i += 1
+        else:
+            # Regular word - KEEP
+            tokens.append(match.group('WORD').lower())
+            tags.append(O_ID)
 
     return tokens, tags
 
@@ -123,41 +128,43 @@ def parse_fillers_only(annotated):
 # Data Loading
 # ============================================================================
 
+def parse_batch(batch):
+    """datasets.map batch function: parse transcripts, dropping empty ones."""
+    all_tokens = []
+    all_tags = []
+
+    for annotated in batch['transcript_annotated']:
+        tokens, tags = parse_fillers_only(annotated)
+        if tokens:
+            all_tokens.append(tokens)
+            all_tags.append(tags)
+
+    return {"tokens": all_tokens, "ner_tags": all_tags}
+
 def prepare_dataset():
     """Load DisfluencySpeech and convert to filler-only classification."""
     print("Loading DisfluencySpeech dataset...")
     ds = load_dataset("amaai-lab/DisfluencySpeech", split="train")
     ds_text = ds.remove_columns(['audio'])
 
-    print(f"Processing {len(ds_text)} examples...")
+    print(f"Processing {len(ds_text)} examples on {NUM_PROC} processes...")
 
-    all_tokens = []
-    all_tags = []
-    filler_count = 0
-
-    for i, example in enumerate(ds_text):
-        tokens, tags = parse_fillers_only(example['transcript_annotated'])
-        if tokens:
-            tag_ids = [LABEL2ID[t] for t in tags]
-            all_tokens.append(tokens)
-            all_tags.append(tag_ids)
-
-            # Count fillers
-            filler_count += sum(1 for t in tags if t != 'O')
+    dataset = ds_text.map(
+        parse_batch,
+        batched=True,
+        batch_size=500,
+        num_proc=NUM_PROC,
+        remove_columns=ds_text.column_names,
+        features=FEATURES
+    )
 
-        if (i + 1) % 1000 == 0:
-            print(f"  Processed {i + 1}/{len(ds_text)}...")
+    # Count fillers
+    filler_count = sum(1 for tags in dataset["ner_tags"] for t in tags if t != O_ID)
 
     print(f"\nDataset stats:")
-    print(f"  Total examples: {len(all_tokens)}")
+    print(f"  Total examples: {len(dataset)}")
     print(f"  Total filler words: {filler_count}")
 
-    # Create dataset
-    dataset = Dataset.from_dict({
-        "tokens": all_tokens,
-        "ner_tags": all_tags
-    })
-
     # Split into train/test
     split = dataset.train_test_split(test_size=0.1, seed=42)
     print(f"  Train: {len(split['train'])}, Test: {len(split['test'])}")
@@ -177,9 +184,11 @@ def tokenize_and_align_labels(examples, tokenizer):
         max_length=256
     )
 
+    # Fast-tokenizer Encodings; reading .word_ids directly skips the per-row accessor
+    encodings = tokenized.encodings
     labels = []
     for i, label in enumerate(examples["ner_tags"]):
-        word_ids = tokenized.word_ids(batch_index=i)
+        word_ids = encodings[i].word_ids
         previous_word_idx = None
         label_ids = []
 
@@ -190,8 +199,8 @@ def tokenize_and_align_labels(examples, tokenizer):
                 label_ids.append(label[word_idx])
             else:
                 orig_label = label[word_idx]
-                if LABEL_LIST[orig_label] == "B-FILL":
-                    label_ids.append(LABEL2ID["I-FILL"])
+                if orig_label == B_FILL_ID:
+                    label_ids.append(I_FILL_ID)
                 else:
                     label_ids.append(orig_label)
             previous_word_idx = word_idx
@@ -199,6 +208,8 @@ def tokenize_and_align_labels(examples, tokenizer):
         labels.append(label_ids)
 
     tokenized["labels"] = labels
+    # Sequence lengths for group_by_length, so the Trainer needn't re-scan input_ids
+    tokenized["length"] = [len(ids) for ids in tokenized["input_ids"]]
     return tokenized
 
 # ============================================================================
@@ -210,18 +221,11 @@ def compute_metrics(eval_pred, seqeval):
     predictions, labels = eval_pred
     predictions = np.argmax(predictions, axis=2)
 
-    true_predictions = []
-    true_labels = []
-
-    for prediction, label in zip(predictions, labels):
-        true_pred = []
-        true_lab = []
-        for p, l in zip(prediction, label):
-            if l != -100:
-                true_pred.append(LABEL_LIST[p])
-                true_lab.append(LABEL_LIST[l])
-        true_predictions.append(true_pred)
-        true_labels.append(true_lab)
+    # Drop special/subword positions per row with a mask, then map ids to names
+    label_names = np.array(LABEL_LIST)
+    keep = labels != -100
+    true_predictions = [label_names[p[k]].tolist() for p, k in zip(predictions, keep)]
+    true_labels = [label_names[l[k]].tolist() for l, k in zip(labels, keep)]
 
     results = seqeval.compute(predictions=true_predictions, references=true_labels)
 
@@ -257,18 +261,26 @@ def main():
     # Tokenize
     print("Tokenizing...")
     tokenized_train = dataset["train"].map(
-        lambda x: tokenize_and_align_labels(x, tokenizer),
+        tokenize_and_align_labels,
+        fn_kwargs={"tokenizer": tokenizer},
         batched=True,
+        num_proc=NUM_PROC,
         remove_columns=dataset["train"].column_names
     )
     tokenized_test = dataset["test"].map(
-        lambda x: tokenize_and_align_labels(x, tokenizer),
+        tokenize_and_align_labels,
+        fn_kwargs={"tokenizer": tokenizer},
         batched=True,
+        num_proc=NUM_PROC,
         remove_columns=dataset["test"].column_names
     )
 
     # Data collator
-    data_collator = DataCollatorForTokenClassification(tokenizer)
+    # Pad to multiples of 8 under mixed precision so matmuls map onto tensor-core tiles
+    data_collator = DataCollatorForTokenClassification(
+        tokenizer,
+        pad_to_multiple_of=8 if USE_FP16 or USE_BF16 else None
+    )
 
     # Evaluation metric
     seqeval = evaluate.load("seqeval")
@@ -278,18 +290,25 @@ def main():
         output_dir=OUTPUT_DIR,
         learning_rate=LEARNING_RATE,
         per_device_train_batch_size=BATCH_SIZE,
-        per_device_eval_batch_size=BATCH_SIZE,
+        per_device_eval_batch_size=EVAL_BATCH_SIZE,
+        gradient_accumulation_steps=GRADIENT_ACCUMULATION_STEPS,
         num_train_epochs=NUM_EPOCHS,
         weight_decay=0.01,
         eval_strategy="epoch",
-        save_strategy="epoch",
-        load_best_model_at_end=True,
-        metric_for_best_model="f1",
+        save_strategy="no",  # Best weights are kept in memory, see KeepBestModelCallback
+        fp16=USE_FP16,
+        bf16=USE_BF16,
+        tf32=USE_BF16,
+        dataloader_num_workers=DATALOADER_WORKERS,
+        dataloader_pin_memory=True,
+        group_by_length=True,  # Batch similar lengths together to cut padding
+        length_column_name="length",
         logging_steps=50,
         report_to="none",
     )
 
     # Trainer
+    best_model = KeepBestModelCallback("f1")
     trainer = Trainer(
         model=model,
         args=training_args,
@@ -298,6 +317,7 @@ def main():
         tokenizer=tokenizer,
         data_collator=data_collator,
         compute_metrics=lambda p: compute_metrics(p, seqeval),
+        callbacks=[best_model],
     )
 
     # Train
@@ -306,6 +326,7 @@ def main():
     print("=" * 60 + "\n")
 
     trainer.train()
+    best_model.restore(trainer.model)
 
     # Final evaluation
     print("\n" + "=" * 60)
@@ -332,7 +353,6 @@ def main():
         "um i was wondering uh if you could help",
     ]
 
-    import torch
     model.eval()
 
     for sentence in test_sentences:
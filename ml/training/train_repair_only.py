@@ -8,12 +8,14 @@ This catches self-corrections like "the store, I mean the mall" or "we were, I w
 Filter: If <50% of reparandum words appear in the following fluent text, it's a repair.
 """
 
+import os
+import multiprocessing as mp
 import re
-import ast
-import csv
+import hashlib
 import numpy as np
+import torch
 from pathlib import Path
-from datasets import Dataset
+from datasets import Dataset, DatasetDict, Features, Sequence, Value, load_from_disk
 from transformers import (
     AutoTokenizer,
     AutoModelForTokenClassification,
@@ -23,19 +25,30 @@ from transformers import (
 )
 import evaluate
 
+from common import parse_switchboard_row, read_switchboard_columns
+
 # ============================================================================
 # Configuration
 # ============================================================================
 
 MODEL_NAME = "distilbert-base-uncased"
+LOWERCASE_WORDS = "uncased" not in MODEL_NAME
 OUTPUT_DIR = str(Path(__file__).parent.parent / "models" / "repair-remover")
 SWITCHBOARD_PATH = "/tmp/switchboard_corrected_reannotated/switchboard_corrected_with_silver_reannotation.tsv"
+TOKENIZED_CACHE_ROOT = Path(__file__).parent / ".tok_cache"
 
 NUM_EPOCHS = 3
 BATCH_SIZE = 16
 LEARNING_RATE = 2e-5
+NUM_PROC = os.cpu_count() or 1  # Processes for parsing/tokenization
+MAX_LENGTH = 256  # Tokenizer truncation length
+PARSE_CHUNK_SIZE = 50000  # Switchboard rows per parsing task
+DATALOADER_WORKERS = 4
 OVERLAP_THRESHOLD = 0.5  # <50% word overlap = repair
 
+USE_BF16 = torch.cuda.is_available() and torch.cuda.is_bf16_supported()
+USE_FP16 = torch.cuda.is_available() and not USE_BF16
+
 # Labels for repair removal
 LABEL_LIST = ["O", "B-REPAIR", "I-REPAIR"]
 LABEL2ID = {label: i for i, label in enumerate(LABEL_LIST)}
@@ -45,6 +58,11 @@ ID2LABEL = {i: label for i, label in enumerate(LABEL_LIST)}
 # Data Loading with Repair Filter
 # ============================================================================
 
+# Switchboard tag groups for the overlap filter
+REPARANDUM_TAGS = frozenset(['BE', 'IE', 'BE_IP'])
+INTERREGNUM_TAGS = frozenset(['IP', 'C_IP', 'C_IE'])
+FLUENT_TAGS = frozenset(['O', 'C'])
+
 def is_repair(words, tags):
     """
     Determine if this example is a repair (vs repetition).
@@ -61,92 +79,107 @@ def is_repair(words, tags):
     seen_interregnum = False
 
     for w, t in zip(words, tags):
-        w_lower = w.lower()
-        if t in ['BE', 'IE', 'BE_IP']:
-            reparandum_words.append(w_lower)
+        if t in REPARANDUM_TAGS:
+            reparandum_words.append(w.lower())
             seen_reparandum = True
-        elif t in ['IP', 'C_IP', 'C_IE']:
-            interregnum_words.append(w_lower)
+        elif t in INTERREGNUM_TAGS:
+            interregnum_words.append(w.lower())
             seen_interregnum = True
-        elif t in ['O', 'C'] and seen_reparandum:
+        elif t in FLUENT_TAGS and seen_reparandum:
             # Fluent words after reparandum
-            repair_words.append(w_lower)
+            repair_words.append(w.lower())
 
     if not reparandum_words:
         return False, [], [], []
 
-    # Check overlap
+    # Check overlap with the first few repair words
     rep_set = set(reparandum_words)
-    repair_set = set(repair_words[:len(reparandum_words) + 3])  # Check nearby words
-
-    overlap = rep_set & repair_set
+    overlap = rep_set.intersection(repair_words[:len(reparandum_words) + 3])
     overlap_ratio = len(overlap) / len(rep_set) if rep_set else 0
 
     # It's a repair if overlap is LESS than threshold
     return overlap_ratio < OVERLAP_THRESHOLD, reparandum_words, interregnum_words, repair_words
 
 
-def convert_tag(tag):
-    """Convert Switchboard tag to our label scheme."""
-    if tag in ['BE', 'BE_IP']:
-        return 'B-REPAIR'
-    elif tag in ['IE', 'IP', 'C_IE', 'C_IP']:
-        return 'I-REPAIR'
-    else:
-        return 'O'
+# Switchboard tag -> our label id in one lookup per token (anything else is O)
+O_ID = LABEL2ID['O']
+B_REPAIR_ID = LABEL2ID['B-REPAIR']
+I_REPAIR_ID = LABEL2ID['I-REPAIR']
+SWBD_TAG_TO_ID = {
+    'BE': B_REPAIR_ID,
+    'BE_IP': B_REPAIR_ID,
+    'IE': I_REPAIR_ID,
+    'IP': I_REPAIR_ID,
+    'C_IE': I_REPAIR_ID,
+    'C_IP': I_REPAIR_ID,
+}
 
+FEATURES = Features({
+    "tokens": Sequence(Value("string")),
+    "ner_tags": Sequence(Value("int8")),
+})
 
-def load_repair_data():
-    """Load Switchboard and filter for repairs only."""
+
+def filter_repair_chunk(rows):
+    """
+    Pool worker: parse a chunk of (sentence, ms_disfl) strings and keep the repairs.
+
+    Returns (tokens_list, tags_list, skipped_no_disfl, skipped_repetition).
+    """
     tokens_list = []
     tags_list = []
+    skipped_no_disfl = 0
+    skipped_repetition = 0
 
-    print(f"Loading Switchboard from {SWITCHBOARD_PATH}...")
-    print(f"Filtering for repairs (overlap < {OVERLAP_THRESHOLD*100:.0f}%)...")
+    for sentence_str, disfl_str in rows:
+        parsed = parse_switchboard_row(sentence_str, disfl_str)
+        if parsed is None:
+            continue
+        words, tags = parsed
 
-    total = 0
-    kept = 0
-    skipped_repetition = 0
-    skipped_no_disfl = 0
+        # Check if this is a repair
+        is_rep, rep_words, interreg_words, repair_words = is_repair(words, tags)
 
-    with open(SWITCHBOARD_PATH, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f, delimiter='\t')
+        if not rep_words:
+            skipped_no_disfl += 1
+            continue
 
-        for row in reader:
-            total += 1
+        if not is_rep:
+            skipped_repetition += 1
+            continue
 
-            try:
-                words = ast.literal_eval(row['sentence'])
-                tags = ast.literal_eval(row['ms_disfl'])
+        # Convert to our format (see LOWERCASE_WORDS)
+        tokens_list.append([w.lower() for w in words] if LOWERCASE_WORDS else words)
+        tags_list.append(np.fromiter((SWBD_TAG_TO_ID.get(t, O_ID) for t in tags), dtype=np.int8, count=len(tags)))
 
-                if len(words) != len(tags):
-                    continue
+    return tokens_list, tags_list, skipped_no_disfl, skipped_repetition
 
-                # Check if this is a repair
-                is_rep, rep_words, interreg_words, repair_words = is_repair(words, tags)
 
-                if not rep_words:
-                    skipped_no_disfl += 1
-                    continue
+def load_repair_data():
+    """Load Switchboard and filter for repairs only."""
+    tokens_list = []
+    tags_list = []
 
-                if not is_rep:
-                    skipped_repetition += 1
-                    continue
+    print(f"Loading Switchboard from {SWITCHBOARD_PATH}...")
+    print(f"Filtering for repairs (overlap < {OVERLAP_THRESHOLD*100:.0f}%)...")
 
-                # Convert to our format
-                tokens = [w.lower() for w in words]
-                converted_tags = [convert_tag(t) for t in tags]
-                tag_ids = [LABEL2ID[t] for t in converted_tags]
+    skipped_no_disfl = 0
+    skipped_repetition = 0
 
-                tokens_list.append(tokens)
-                tags_list.append(tag_ids)
-                kept += 1
+    sentences, disfl_tags, malformed = read_switchboard_columns(SWITCHBOARD_PATH)
+    total = malformed + len(sentences)  # Malformed rows count as examples, as before
+    rows = list(zip(sentences, disfl_tags))
+    chunks = (rows[i:i + PARSE_CHUNK_SIZE] for i in range(0, len(rows), PARSE_CHUNK_SIZE))
 
-                if kept % 10000 == 0:
-                    print(f"  Kept {kept} repairs...")
+    with mp.Pool(NUM_PROC) as pool:
+        for tokens, tags, no_disfl, other in pool.imap(filter_repair_chunk, chunks):
+            tokens_list.extend(tokens)
+            tags_list.extend(tags)
+            skipped_no_disfl += no_disfl
+            skipped_repetition += other
+            print(f"  Kept {len(tokens_list)} repairs...")
 
-            except (ValueError, SyntaxError):
-                continue
+    kept = len(tokens_list)
 
     print(f"\nSwitchboard filtering complete:")
     print(f"  Total examples:      {total}")
@@ -165,7 +198,7 @@ def prepare_dataset():
     dataset = Dataset.from_dict({
         "tokens": tokens,
         "ner_tags": tags
-    })
+    }, features=FEATURES)
 
     # 90/10 split (less data, want good eval set)
     split = dataset.train_test_split(test_size=0.10, seed=42)
@@ -183,12 +216,13 @@ def tokenize_and_align_labels(examples, tokenizer):
         examples["tokens"],
         truncation=True,
         is_split_into_words=True,
-        max_length=256
+        max_length=MAX_LENGTH
     )
 
+    encodings = tokenized.encodings
     labels = []
     for i, label in enumerate(examples["ner_tags"]):
-        word_ids = tokenized.word_ids(batch_index=i)
+        word_ids = encodings[i].word_ids
         previous_word_idx = None
         label_ids = []
 
@@ -200,15 +234,13 @@ def tokenize_and_align_labels(examples, tokenizer):
             else:
                 # Subword: use I- tag if original was B-
                 orig_label = label[word_idx]
-                if LABEL_LIST[orig_label] == "B-REPAIR":
-                    label_ids.append(LABEL2ID["I-REPAIR"])
-                else:
-                    label_ids.append(orig_label)
+                label_ids.append(I_REPAIR_ID if orig_label == B_REPAIR_ID else orig_label)
             previous_word_idx = word_idx
 
         labels.append(label_ids)
 
     tokenized["labels"] = labels
+    tokenized["length"] = [len(ids) for ids in tokenized["input_ids"]]
     return tokenized
 
 # ============================================================================
@@ -220,18 +252,10 @@ def compute_metrics(eval_pred, seqeval):
     predictions, labels = eval_pred
     predictions = np.argmax(predictions, axis=2)
 
-    true_predictions = []
-    true_labels = []
-
-    for prediction, label in zip(predictions, labels):
-        true_pred = []
-        true_lab = []
-        for p, l in zip(prediction, label):
-            if l != -100:
-                true_pred.append(LABEL_LIST[p])
-                true_lab.append(LABEL_LIST[l])
-        true_predictions.append(true_pred)
-        true_labels.append(true_lab)
+    label_names = np.array(LABEL_LIST)
+    keep = labels != -100
+    true_predictions = [label_names[p[k]].tolist() for p, k in zip(predictions, keep)]
+    true_labels = [label_names[l[k]].tolist() for l, k in zip(labels, keep)]
 
     results = seqeval.compute(predictions=true_predictions, references=true_labels)
 
@@ -242,6 +266,27 @@ def compute_metrics(eval_pred, seqeval):
         "accuracy": results["overall_accuracy"],
     }
 
+# ============================================================================
+# Tokenized Dataset Cache
+# ============================================================================
+
+def tokenized_cache_dir():
+    """
+    Directory for this run's tokenized splits, keyed on everything that shapes them.
+
+    Hyperparameters (epochs, LR, batch size) aren't part of the key, so sweeps reuse
+    one tokenization. Delete TOKENIZED_CACHE_ROOT after changing parsing code.
+    """
+    key = "|".join(str(part) for part in (
+        Path(__file__).stem,
+        MODEL_NAME,
+        MAX_LENGTH,
+        LABEL_LIST,
+        OVERLAP_THRESHOLD,
+        Path(SWITCHBOARD_PATH).stat().st_mtime_ns,
+    ))
+    return TOKENIZED_CACHE_ROOT / hashlib.md5(key.encode()).hexdigest()
+
 # ============================================================================
 # Main Training
 # ============================================================================
@@ -251,12 +296,10 @@ def main():
     print("REPAIR-ONLY MODEL TRAINING")
     print("=" * 60)
 
-    # Prepare data
-    dataset = prepare_dataset()
-
     # Load tokenizer and model
     print(f"\nLoading {MODEL_NAME}...")
     tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    assert LOWERCASE_WORDS or tokenizer.do_lower_case, f"{MODEL_NAME} is cased; set LOWERCASE_WORDS"
     model = AutoModelForTokenClassification.from_pretrained(
         MODEL_NAME,
         num_labels=len(LABEL_LIST),
@@ -264,21 +307,35 @@ def main():
         label2id=LABEL2ID
     )
 
-    # Tokenize
-    print("Tokenizing...")
-    tokenized_train = dataset["train"].map(
-        lambda x: tokenize_and_align_labels(x, tokenizer),
-        batched=True,
-        remove_columns=dataset["train"].column_names
-    )
-    tokenized_test = dataset["test"].map(
-        lambda x: tokenize_and_align_labels(x, tokenizer),
-        batched=True,
-        remove_columns=dataset["test"].column_names
-    )
+    # Prepare and tokenize data, or reuse an earlier run's tokenized splits
+    cache_dir = tokenized_cache_dir()
+    if cache_dir.exists():
+        print(f"Loading tokenized splits from {cache_dir}...")
+        tokenized = load_from_disk(str(cache_dir))
+    else:
+        dataset = prepare_dataset()
+
+        print("Tokenizing...")
+        tokenized = DatasetDict({
+            split: dataset[split].map(
+                tokenize_and_align_labels,
+                fn_kwargs={"tokenizer": tokenizer},
+                batched=True,
+                num_proc=NUM_PROC,
+                remove_columns=dataset[split].column_names
+            )
+            for split in ("train", "test")
+        })
+        tokenized.save_to_disk(str(cache_dir))
+
+    tokenized_train = tokenized["train"]
+    tokenized_test = tokenized["test"]
 
     # Training setup
-    data_collator = DataCollatorForTokenClassification(tokenizer)
+    data_collator = DataCollatorForTokenClassification(
+        tokenizer,
+        pad_to_multiple_of=8 if USE_FP16 or USE_BF16 else None
+    )
     seqeval = evaluate.load("seqeval")
 
     training_args = TrainingArguments(
@@ -292,6 +349,13 @@ def main():
         save_strategy="epoch",
         load_best_model_at_end=True,
         metric_for_best_model="f1",
+        fp16=USE_FP16,
+        bf16=USE_BF16,
+        tf32=USE_BF16,
+        dataloader_num_workers=DATALOADER_WORKERS,
+        dataloader_pin_memory=True,
+        group_by_length=True,
+        length_column_name="length",
         logging_steps=200,
         report_to="none",
     )
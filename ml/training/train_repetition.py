@@ -6,11 +6,23 @@ Trains a DistilBERT model on DisfluencySpeech + Switchboard datasets to tag word
 Tags: O (keep), B-REP/I-REP (repair/reparandum - remove)
 """
 
-import re
-import ast
-import csv
+import os
+import multiprocessing as mp
+import hashlib
 import numpy as np
-from datasets import load_dataset, Dataset
+import torch
+from pathlib import Path
+from datasets import (
+    load_dataset,
+    concatenate_datasets,
+    ClassLabel,
+    Dataset,
+    DatasetDict,
+    Features,
+    Sequence,
+    Value,
+    load_from_disk
+)
 from transformers import (
     AutoTokenizer,
     AutoModelForTokenClassification,
@@ -20,102 +32,105 @@ from transformers import (
 )
 import evaluate
 
+from common import iter_markup_tokens, parse_switchboard_row, read_switchboard_columns
+
 # ============================================================================
 # Configuration
 # ============================================================================
 
 MODEL_NAME = "distilbert-base-uncased"
+# The uncased tokenizer lowercases on its own; only a cased model needs
+# Switchboard words lowercased while loading
+LOWERCASE_WORDS = "uncased" not in MODEL_NAME
 OUTPUT_DIR = "/tmp/disfluency-tagger-combined"
+SWITCHBOARD_PATH = "/tmp/switchboard_corrected_reannotated/switchboard_corrected_with_silver_reannotation.tsv"
+TOKENIZED_CACHE_ROOT = Path(__file__).parent / ".tok_cache"
 NUM_EPOCHS = 3
 BATCH_SIZE = 16
 LEARNING_RATE = 2e-5
+NUM_PROC = os.cpu_count() or 1  # Processes for dataset parsing/tokenization
+MAX_LENGTH = 256  # Tokenizer truncation length
+PARSE_CHUNK_SIZE = 50000  # Switchboard rows per parsing task
+DATALOADER_WORKERS = 4
+
+USE_BF16 = torch.cuda.is_available() and torch.cuda.is_bf16_supported()
+USE_FP16 = torch.cuda.is_available() and not USE_BF16
 
 # Simplified labels - just O (keep) and REP (remove)
 LABEL_LIST = ["O", "B-REP", "I-REP"]
 LABEL2ID = {label: i for i, label in enumerate(LABEL_LIST)}
 ID2LABEL = {i: label for i, label in enumerate(LABEL_LIST)}
 
+# Integer ids, so the parsers emit model labels directly
+O_ID = LABEL2ID["O"]
+B_REP_ID = LABEL2ID["B-REP"]
+I_REP_ID = LABEL2ID["I-REP"]
+
+FEATURES = Features({
+    "tokens": Sequence(Value("string")),
+    "ner_tags": Sequence(ClassLabel(names=LABEL_LIST)),
+})
+
 # ============================================================================
 # DisfluencySpeech Parsing (existing logic)
 # ============================================================================
 
 def parse_disfluency_speech_transcript(annotated):
-    """Parse DisfluencySpeech annotated transcript into tokens and BIO tags."""
+    """Parse DisfluencySpeech annotated transcript into tokens and BIO tag ids."""
     tokens = []
     tags = []
 
-    # Remove non-speech markers like <laughter>
-    text = re.sub(r'<[^>]+>', '', annotated)
+    for match in iter_markup_tokens(annotated):
+        kind = match.lastgroup
 
-    i = 0
-    while i < len(text):
-        # Check for filler {F ... } - REMOVE
-        filler_match = re.match(r'\{F\s+([^}]+)\}', text[i:])
-        if filler_match:
-            content = filler_match.group(1).strip()
-            words = content.replace(',', '').split()
+        if kind == 'F':
+            # Filler {F ... } - REMOVE
+            content = match.group('f').strip()
+            words = content.split()
             for j, word in enumerate(words):
                 if word:
                     tokens.append(word.lower())
-                    tags.append('B-REP' if j == 0 else 'I-REP')
-            i += filler_match.end()
-            continue
+                    tags.append(B_REP_ID if j == 0 else I_REP_ID)
 
-        # Check for discourse marker {D ... } - REMOVE
-        disc_match = re.match(r'\{D\s+([^}]+)\}', text[i:])
-        if disc_match:
-            content = disc_match.group(1).strip()
-            words = content.replace(',', '').split()
+        elif kind == 'D':
+            # Discourse marker {D ... } - REMOVE
+            content = match.group('d').strip()
+            words = content.split()
             for j, word in enumerate(words):
                 if word:
                     tokens.append(word.lower())
-                    tags.append('B-REP' if j == 0 else 'I-REP')
-            i += disc_match.end()
-            continue
+                    tags.append(B_REP_ID if j == 0 else I_REP_ID)
 
-        # Check for conjunction {C ... } - KEEP these
-        conj_match = re.match(r'\{C\s+([^}]+)\}', text[i:])
-        if conj_match:
-            content = conj_match.group(1).strip()
-            words = content.replace(',', '').split()
+        elif kind == 'C':
+            # Conjunction {C ... } - KEEP
+            content = match.group('c').strip()
+            words = content.split()
             for word in words:
                 if word:
                     tokens.append(word.lower())
-                    tags.append('O')
-            i += conj_match.end()
-            continue
+                    tags.append(O_ID)
 
-        # Check for repair [ ... + ... ] - before part REMOVED, after part KEPT
-        repair_match = re.match(r'\[\s*([^+\]]*)\+\s*([^\]]*)\]', text[i:])
-        if repair_match:
-            before = repair_match.group(1).strip()
-            after = repair_match.group(2).strip()
+        elif kind == 'REPAIR':
+            # Repair [ ... + ... ] - before part REMOVED, after part KEPT
+            before = match.group('before').strip()
+            after = match.group('after').strip()
 
-            before_words = before.replace(',', '').split()
+            before_words = before.split()
             for j, word in enumerate(before_words):
                 if word and not word.startswith('-'):
                     tokens.append(word.lower())
-                    tags.append('B-REP' if j == 0 else 'I-REP')
+                    tags.append(B_REP_ID if j == 0 else I_REP_ID)
 
-            after_words = after.replace(',', '').split()
+            after_words = after.split()
             for word in after_words:
                 if word and not word.startswith('-'):
                     tokens.append(word.lower())
-                    tags.append('O')
+                    tags.append(O_ID)
 
-            i += repair_match.end()
-            continue
-
-        # Regular word - KEEP
-        word_match = re.match(r"[\w']+", text[i:])
-        if word_match:
-            word = word_match.group(0)
-            tokens.append(word.lower())
-            tags.append('O')
-            i += word_match.end()
-            continue
-
-        i += 1
+        else:
+            # Regular word - KEEP
+            tokens.append(match.group('WORD').lower())
+            tags.append(O_ID)
 
     return tokens, tags
 
@@ -123,117 +138,125 @@ def parse_disfluency_speech_transcript(annotated):
 # Switchboard Parsing
 # ============================================================================
 
-def convert_switchboard_tag(tag):
-    """Convert Switchboard BIO tag to our simplified scheme.
-
-    Switchboard tags:
-    - BE, IE, IP, BE_IP, C_IE, C_IP = reparandum (REMOVE)
-    - O, C = keep
-    """
-    if tag in ['BE', 'BE_IP']:
-        return 'B-REP'
-    elif tag in ['IE', 'IP', 'C_IE', 'C_IP']:
-        return 'I-REP'
-    else:  # 'O' or 'C'
-        return 'O'
-
-def load_switchboard_data(filepath):
-    """Load and parse Switchboard TSV file."""
-    tokens_list = []
-    tags_list = []
-
-    print(f"Loading Switchboard from {filepath}...")
-
-    with open(filepath, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f, delimiter='\t')
-
-        count = 0
-        skipped = 0
+# Switchboard BIO tag -> our simplified scheme (as a label id), one lookup per token:
+# - BE, IE, IP, BE_IP, C_IE, C_IP = reparandum (REMOVE)
+# - O, C (anything not listed) = keep, via .get(tag, O_ID)
+SWBD_TAG_TO_ID = {
+    'BE': B_REP_ID,
+    'BE_IP': B_REP_ID,
+    'IE': I_REP_ID,
+    'IP': I_REP_ID,
+    'C_IE': I_REP_ID,
+    'C_IP': I_REP_ID,
+}
+
+def parse_switchboard_chunk(rows):
+    """Pool worker: parse (sentence, ms_disfl) strings into examples. Returns (examples, skipped)."""
+    examples = []
+    skipped = 0
+
+    for sentence_str, disfl_str in rows:
+        # Parse the sentence and disfluency tags (stored as Python list strings)
+        parsed = parse_switchboard_row(sentence_str, disfl_str)
+        if parsed is None:
+            skipped += 1
+            continue
+        sentence, ms_disfl = parsed
 
-        for row in reader:
-            try:
-                # Parse the sentence (stored as Python list string)
-                sentence = ast.literal_eval(row['sentence'])
-                # Parse the disfluency tags
-                ms_disfl = ast.literal_eval(row['ms_disfl'])
+        # Convert to our tag scheme (label ids); see LOWERCASE_WORDS
+        tokens = [w.lower() for w in sentence] if LOWERCASE_WORDS else sentence
+        tag_ids = [SWBD_TAG_TO_ID.get(t, O_ID) for t in ms_disfl]
+        examples.append({"tokens": tokens, "ner_tags": tag_ids})
 
-                if len(sentence) != len(ms_disfl):
-                    skipped += 1
-                    continue
+    return examples, skipped
 
-                # Convert to lowercase and our tag scheme
-                tokens = [w.lower() for w in sentence]
-                tags = [convert_switchboard_tag(t) for t in ms_disfl]
+def iter_switchboard_data(filepath, source_stamp=None):
+    """
+    Parse Switchboard TSV file across NUM_PROC processes, yielding one example at a time.
 
-                # Convert label strings to IDs
-                tag_ids = [LABEL2ID[t] for t in tags]
+    source_stamp is unused here; it only feeds from_generator's cache fingerprint.
+    """
+    print(f"Loading Switchboard from {filepath}...")
 
-                tokens_list.append(tokens)
-                tags_list.append(tag_ids)
-                count += 1
+    sentences, disfl_tags, malformed = read_switchboard_columns(filepath)
+    rows = list(zip(sentences, disfl_tags))
+    chunks = (rows[i:i + PARSE_CHUNK_SIZE] for i in range(0, len(rows), PARSE_CHUNK_SIZE))
 
-                if count % 50000 == 0:
-                    print(f"  Processed {count} examples...")
+    count = 0
+    skipped = malformed
 
-            except (ValueError, SyntaxError) as e:
-                skipped += 1
-                continue
+    # imap (not imap_unordered) keeps file order, so the seeded split stays reproducible
+    with mp.Pool(NUM_PROC) as pool:
+        for examples, chunk_skipped in pool.imap(parse_switchboard_chunk, chunks):
+            yield from examples
+            count += len(examples)
+            skipped += chunk_skipped
+            print(f"  Processed {count} examples...")
 
     print(f"Loaded {count} Switchboard examples (skipped {skipped})")
-    return tokens_list, tags_list
+
+def load_switchboard_data(filepath):
+    """Stream Switchboard straight into an Arrow-backed Dataset."""
+    # from_generator caches on its gen_kwargs; include the file's size/mtime so a
+    # TSV regenerated at the same path isn't served from a stale Arrow cache
+    stat = Path(filepath).stat()
+    return Dataset.from_generator(
+        iter_switchboard_data,
+        gen_kwargs={"filepath": filepath, "source_stamp": (stat.st_size, stat.st_mtime_ns)},
+        features=FEATURES
+    )
 
 # ============================================================================
 # Data Loading and Preparation
 # ============================================================================
 
-def load_disfluency_speech():
-    """Load DisfluencySpeech and convert to token classification format."""
-    print("Loading DisfluencySpeech dataset...")
-    ds = load_dataset("amaai-lab/DisfluencySpeech", split="train")
-    ds_text = ds.remove_columns(['audio'])
-
-    print(f"Processing {len(ds_text)} DisfluencySpeech examples...")
-
+def parse_batch(batch):
+    """datasets.map batch function: parse transcripts, dropping empty ones."""
     all_tokens = []
     all_tags = []
 
-    for i, example in enumerate(ds_text):
-        tokens, tags = parse_disfluency_speech_transcript(example['transcript_annotated'])
+    for annotated in batch['transcript_annotated']:
+        tokens, tags = parse_disfluency_speech_transcript(annotated)
         if tokens:
-            # Convert to IDs
-            tag_ids = [LABEL2ID[t] for t in tags]
             all_tokens.append(tokens)
-            all_tags.append(tag_ids)
+            all_tags.append(tags)
 
-        if (i + 1) % 1000 == 0:
-            print(f"  Processed {i + 1}/{len(ds_text)}...")
+    return {"tokens": all_tokens, "ner_tags": all_tags}
+
+def load_disfluency_speech():
+    """Load DisfluencySpeech as a token classification Dataset."""
+    print("Loading DisfluencySpeech dataset...")
+    ds = load_dataset("amaai-lab/DisfluencySpeech", split="train")
+    ds_text = ds.remove_columns(['audio'])
 
-    print(f"Loaded {len(all_tokens)} DisfluencySpeech examples")
-    return all_tokens, all_tags
+    print(f"Processing {len(ds_text)} DisfluencySpeech examples on {NUM_PROC} processes...")
+
+    parsed = ds_text.map(
+        parse_batch,
+        batched=True,
+        batch_size=500,
+        num_proc=NUM_PROC,
+        remove_columns=ds_text.column_names,
+        features=FEATURES
+    )
+
+    print(f"Loaded {len(parsed)} DisfluencySpeech examples")
+    return parsed
 
 def prepare_combined_dataset():
     """Load both datasets and combine them."""
     # Load DisfluencySpeech
-    ds_tokens, ds_tags = load_disfluency_speech()
+    ds_disfluency = load_disfluency_speech()
 
     # Load Switchboard
-    swbd_tokens, swbd_tags = load_switchboard_data(
-        "/tmp/switchboard_corrected_reannotated/switchboard_corrected_with_silver_reannotation.tsv"
-    )
+    ds_switchboard = load_switchboard_data(SWITCHBOARD_PATH)
 
-    # Combine
-    all_tokens = ds_tokens + swbd_tokens
-    all_tags = ds_tags + swbd_tags
+    # Combine (both share FEATURES, so this only stacks Arrow tables)
+    dataset = concatenate_datasets([ds_disfluency, ds_switchboard])
 
-    print(f"\nCombined dataset: {len(all_tokens)} total examples")
-    print(f"  - DisfluencySpeech: {len(ds_tokens)}")
-    print(f"  - Switchboard: {len(swbd_tokens)}")
-
-    # Create dataset
-    dataset = Dataset.from_dict({
-        "tokens": all_tokens,
-        "ner_tags": all_tags
-    })
+    print(f"\nCombined dataset: {len(dataset)} total examples")
+    print(f"  - DisfluencySpeech: {len(ds_disfluency)}")
+    print(f"  - Switchboard: {len(ds_switchboard)}")
 
     # Split into train/test (95/5 - we have lots of data now)
     split = dataset.train_test_split(test_size=0.05, seed=42)
@@ -252,32 +275,27 @@ def tokenize_and_align_labels(examples, tokenizer):
         examples["tokens"],
         truncation=True,
         is_split_into_words=True,
-        max_length=256
+        max_length=MAX_LENGTH
     )
 
+    encodings = tokenized.encodings
     labels = []
     for i, label in enumerate(examples["ner_tags"]):
-        word_ids = tokenized.word_ids(batch_index=i)
-        previous_word_idx = None
-        label_ids = []
-
-        for word_idx in word_ids:
-            if word_idx is None:
-                label_ids.append(-100)  # Special tokens
-            elif word_idx != previous_word_idx:
-                label_ids.append(label[word_idx])
-            else:
-                # For subword tokens, use I- tag if original was B-
-                orig_label = label[word_idx]
-                if LABEL_LIST[orig_label] == "B-REP":
-                    label_ids.append(LABEL2ID["I-REP"])
-                else:
-                    label_ids.append(orig_label)
-            previous_word_idx = word_idx
-
-        labels.append(label_ids)
+        # Special tokens (word id None -> -1) gather the trailing -100 sentinel
+        word_ids = np.array(
+            [-1 if w is None else w for w in encodings[i].word_ids], dtype=np.int64
+        )
+        label_ids = np.append(np.asarray(label, dtype=np.int64), -100)[word_ids]
+
+        # Subword continuation: use I- tag if original was B-
+        is_cont = np.zeros(len(word_ids), dtype=bool)
+        is_cont[1:] = (word_ids[1:] == word_ids[:-1]) & (word_ids[1:] >= 0)
+        label_ids[is_cont & (label_ids == B_REP_ID)] = I_REP_ID
+
+        labels.append(label_ids.tolist())
 
     tokenized["labels"] = labels
+    tokenized["length"] = [len(ids) for ids in tokenized["input_ids"]]
     return tokenized
 
 # ============================================================================
@@ -289,18 +307,10 @@ def compute_metrics(eval_pred, seqeval):
     predictions, labels = eval_pred
     predictions = np.argmax(predictions, axis=2)
 
-    true_predictions = []
-    true_labels = []
-
-    for prediction, label in zip(predictions, labels):
-        true_pred = []
-        true_lab = []
-        for p, l in zip(prediction, label):
-            if l != -100:
-                true_pred.append(LABEL_LIST[p])
-                true_lab.append(LABEL_LIST[l])
-        true_predictions.append(true_pred)
-        true_labels.append(true_lab)
+    label_names = np.array(LABEL_LIST)
+    keep = labels != -100
+    true_predictions = [label_names[p[k]].tolist() for p, k in zip(predictions, keep)]
+    true_labels = [label_names[l[k]].tolist() for l, k in zip(labels, keep)]
 
     results = seqeval.compute(predictions=true_predictions, references=true_labels)
 
@@ -311,6 +321,27 @@ def compute_metrics(eval_pred, seqeval):
         "accuracy": results["overall_accuracy"],
     }
 
+# ============================================================================
+# Tokenized Dataset Cache
+# ============================================================================
+
+def tokenized_cache_dir():
+    """
+    Directory for this run's tokenized splits, keyed on everything that shapes them.
+
+    Hyperparameters (epochs, LR, batch size) aren't part of the key, so sweeps reuse
+    one tokenization. Delete TOKENIZED_CACHE_ROOT after changing parsing code.
+    """
+    key = "|".join(str(part) for part in (
+        Path(__file__).stem,
+        MODEL_NAME,
+        MAX_LENGTH,
+        LABEL_LIST,
+        "amaai-lab/DisfluencySpeech",
+        Path(SWITCHBOARD_PATH).stat().st_mtime_ns,
+    ))
+    return TOKENIZED_CACHE_ROOT / hashlib.md5(key.encode()).hexdigest()
+
 # ============================================================================
 # Main Training
 # ============================================================================
@@ -320,12 +351,10 @@ def main():
     print("BERT DISFLUENCY TAGGER TRAINING - COMBINED DATASET")
     print("="*60)
 
-    # Prepare data
-    dataset = prepare_combined_dataset()
-
     # Load tokenizer and model
     print(f"\nLoading {MODEL_NAME}...")
     tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    assert LOWERCASE_WORDS or tokenizer.do_lower_case, f"{MODEL_NAME} is cased; set LOWERCASE_WORDS"
     model = AutoModelForTokenClassification.from_pretrained(
         MODEL_NAME,
         num_labels=len(LABEL_LIST),
@@ -333,21 +362,35 @@ def main():
         label2id=LABEL2ID
     )
 
-    # Tokenize datasets
-    print("Tokenizing...")
-    tokenized_train = dataset["train"].map(
-        lambda x: tokenize_and_align_labels(x, tokenizer),
-        batched=True,
-        remove_columns=dataset["train"].column_names
-    )
-    tokenized_test = dataset["test"].map(
-        lambda x: tokenize_and_align_labels(x, tokenizer),
-        batched=True,
-        remove_columns=dataset["test"].column_names
-    )
+    # Prepare and tokenize data, or reuse an earlier run's tokenized splits
+    cache_dir = tokenized_cache_dir()
+    if cache_dir.exists():
+        print(f"Loading tokenized splits from {cache_dir}...")
+        tokenized = load_from_disk(str(cache_dir))
+    else:
+        dataset = prepare_combined_dataset()
+
+        print("Tokenizing...")
+        tokenized = DatasetDict({
+            split: dataset[split].map(
+                tokenize_and_align_labels,
+                fn_kwargs={"tokenizer": tokenizer},
+                batched=True,
+                num_proc=NUM_PROC,
+                remove_columns=dataset[split].column_names
+            )
+            for split in ("train", "test")
+        })
+        tokenized.save_to_disk(str(cache_dir))
+
+    tokenized_train = tokenized["train"]
+    tokenized_test = tokenized["test"]
 
     # Data collator
-    data_collator = DataCollatorForTokenClassification(tokenizer)
+    data_collator = DataCollatorForTokenClassification(
+        tokenizer,
+        pad_to_multiple_of=8 if USE_FP16 or USE_BF16 else None
+    )
 
     # Evaluation metric
     seqeval = evaluate.load("seqeval")
@@ -364,6 +407,13 @@ def main():
         save_strategy="epoch",
         load_best_model_at_end=True,
         metric_for_best_model="f1",
+        fp16=USE_FP16,
+        bf16=USE_BF16,
+        tf32=USE_BF16,
+        dataloader_num_workers=DATALOADER_WORKERS,
+        dataloader_pin_memory=True,
+        group_by_length=True,
+        length_column_name="length",
         logging_steps=500,
         report_to="none",  # Disable wandb
     )
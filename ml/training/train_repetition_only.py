@@ -8,12 +8,14 @@ This catches simple repetitions like "I I think" or "to to go".
 Filter: If 50%+ of reparandum words appear in the following fluent text, it's a repetition.
 """
 
+import os
+import multiprocessing as mp
 import re
-import ast
-import csv
+import hashlib
 import numpy as np
+import torch
 from pathlib import Path
-from datasets import Dataset
+from datasets import Dataset, DatasetDict, Features, Sequence, Value, load_from_disk
 from transformers import (
     AutoTokenizer,
     AutoModelForTokenClassification,
@@ -23,19 +25,30 @@ from transformers import (
 )
 import evaluate
 
+from common import parse_switchboard_row, read_switchboard_columns
+
 # ============================================================================
 # Configuration
 # ============================================================================
 
 MODEL_NAME = "distilbert-base-uncased"
+LOWERCASE_WORDS = "uncased" not in MODEL_NAME
 OUTPUT_DIR = str(Path(__file__).parent.parent / "models" / "repetition-remover")
 SWITCHBOARD_PATH = "/tmp/switchboard_corrected_reannotated/switchboard_corrected_with_silver_reannotation.tsv"
+TOKENIZED_CACHE_ROOT = Path(__file__).parent / ".tok_cache"
 
 NUM_EPOCHS = 3
 BATCH_SIZE = 16
 LEARNING_RATE = 2e-5
+NUM_PROC = os.cpu_count() or 1  # Processes for parsing/tokenization
+MAX_LENGTH = 256  # Tokenizer truncation length
+PARSE_CHUNK_SIZE = 50000  # Switchboard rows per parsing task
+DATALOADER_WORKERS = 4
 OVERLAP_THRESHOLD = 0.5  # 50% word overlap = repetition
 
+USE_BF16 = torch.cuda.is_available() and torch.cuda.is_bf16_supported()
+USE_FP16 = torch.cuda.is_available() and not USE_BF16
+
 # Labels for repetition removal
 LABEL_LIST = ["O", "B-REP", "I-REP"]
 LABEL2ID = {label: i for i, label in enumerate(LABEL_LIST)}
@@ -45,6 +58,10 @@ ID2LABEL = {i: label for i, label in enumerate(LABEL_LIST)}
 # Data Loading with Repetition Filter
 # ============================================================================
 
+# Switchboard tag groups for the overlap filter
+REPARANDUM_TAGS = frozenset(['BE', 'IE', 'BE_IP'])
+FLUENT_TAGS = frozenset(['O', 'C'])
+
 def is_repetition(words, tags):
     """
     Determine if this example is a repetition (vs repair).
@@ -59,88 +76,104 @@ def is_repetition(words, tags):
     seen_reparandum = False
 
     for w, t in zip(words, tags):
-        w_lower = w.lower()
-        if t in ['BE', 'IE', 'BE_IP']:
-            reparandum_words.append(w_lower)
+        if t in REPARANDUM_TAGS:
+            reparandum_words.append(w.lower())
             seen_reparandum = True
-        elif t in ['O', 'C'] and seen_reparandum:
+        elif t in FLUENT_TAGS and seen_reparandum:
             # Fluent words after reparandum
-            repair_words.append(w_lower)
+            repair_words.append(w.lower())
 
     if not reparandum_words:
         return False, [], []
 
-    # Check overlap
+    # Check overlap against nearby words (intersection takes the slice directly)
     rep_set = set(reparandum_words)
-    repair_set = set(repair_words[:len(reparandum_words) + 3])  # Check nearby words
-
-    overlap = rep_set & repair_set
+    overlap = rep_set.intersection(repair_words[:len(reparandum_words) + 3])
     overlap_ratio = len(overlap) / len(rep_set) if rep_set else 0
 
     return overlap_ratio >= OVERLAP_THRESHOLD, reparandum_words, repair_words
 
 
-def convert_tag(tag):
-    """Convert Switchboard tag to our label scheme."""
-    if tag in ['BE', 'BE_IP']:
-        return 'B-REP'
-    elif tag in ['IE', 'IP', 'C_IE', 'C_IP']:
-        return 'I-REP'
-    else:
-        return 'O'
+# Switchboard tag -> our label id in one lookup per token (anything else is O)
+O_ID = LABEL2ID['O']
+B_REP_ID = LABEL2ID['B-REP']
+I_REP_ID = LABEL2ID['I-REP']
+SWBD_TAG_TO_ID = {
+    'BE': B_REP_ID,
+    'BE_IP': B_REP_ID,
+    'IE': I_REP_ID,
+    'IP': I_REP_ID,
+    'C_IE': I_REP_ID,
+    'C_IP': I_REP_ID,
+}
 
+# Tags are kept as int8 arrays from parsing onwards (3 labels), not lists of boxed ints
+FEATURES = Features({
+    "tokens": Sequence(Value("string")),
+    "ner_tags": Sequence(Value("int8")),
+})
 
-def load_repetition_data():
-    """Load Switchboard and filter for repetitions only."""
+
+def filter_repetition_chunk(rows):
+    """
+    Pool worker: parse a chunk of (sentence, ms_disfl) strings and keep the repetitions.
+
+    Returns (tokens_list, tags_list, skipped_no_disfl, skipped_repair).
+    """
     tokens_list = []
     tags_list = []
+    skipped_no_disfl = 0
+    skipped_repair = 0
 
-    print(f"Loading Switchboard from {SWITCHBOARD_PATH}...")
-    print(f"Filtering for repetitions (overlap >= {OVERLAP_THRESHOLD*100:.0f}%)...")
+    for sentence_str, disfl_str in rows:
+        parsed = parse_switchboard_row(sentence_str, disfl_str)
+        if parsed is None:
+            continue
+        words, tags = parsed
 
-    total = 0
-    kept = 0
-    skipped_repair = 0
-    skipped_no_disfl = 0
+        # Check if this is a repetition
+        is_rep, rep_words, repair_words = is_repetition(words, tags)
 
-    with open(SWITCHBOARD_PATH, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f, delimiter='\t')
+        if not rep_words:
+            skipped_no_disfl += 1
+            continue
 
-        for row in reader:
-            total += 1
+        if not is_rep:
+            skipped_repair += 1
+            continue
 
-            try:
-                words = ast.literal_eval(row['sentence'])
-                tags = ast.literal_eval(row['ms_disfl'])
+        # Convert to our format (see LOWERCASE_WORDS)
+        tokens_list.append([w.lower() for w in words] if LOWERCASE_WORDS else words)
+        tags_list.append(np.fromiter((SWBD_TAG_TO_ID.get(t, O_ID) for t in tags), dtype=np.int8, count=len(tags)))
 
-                if len(words) != len(tags):
-                    continue
+    return tokens_list, tags_list, skipped_no_disfl, skipped_repair
 
-                # Check if this is a repetition
-                is_rep, rep_words, repair_words = is_repetition(words, tags)
 
-                if not rep_words:
-                    skipped_no_disfl += 1
-                    continue
+def load_repetition_data():
+    """Load Switchboard and filter for repetitions only."""
+    tokens_list = []
+    tags_list = []
 
-                if not is_rep:
-                    skipped_repair += 1
-                    continue
+    print(f"Loading Switchboard from {SWITCHBOARD_PATH}...")
+    print(f"Filtering for repetitions (overlap >= {OVERLAP_THRESHOLD*100:.0f}%)...")
 
-                # Convert to our format
-                tokens = [w.lower() for w in words]
-                converted_tags = [convert_tag(t) for t in tags]
-                tag_ids = [LABEL2ID[t] for t in converted_tags]
+    skipped_no_disfl = 0
+    skipped_repair = 0
 
-                tokens_list.append(tokens)
-                tags_list.append(tag_ids)
-                kept += 1
+    sentences, disfl_tags, malformed = read_switchboard_columns(SWITCHBOARD_PATH)
+    total = malformed + len(sentences)  # Malformed rows count as examples, as before
+    rows = list(zip(sentences, disfl_tags))
+    chunks = (rows[i:i + PARSE_CHUNK_SIZE] for i in range(0, len(rows), PARSE_CHUNK_SIZE))
 
-                if kept % 25000 == 0:
-                    print(f"  Kept {kept} repetitions...")
+    with mp.Pool(NUM_PROC) as pool:
+        for tokens, tags, no_disfl, other in pool.imap(filter_repetition_chunk, chunks):
+            tokens_list.extend(tokens)
+            tags_list.extend(tags)
+            skipped_no_disfl += no_disfl
+            skipped_repair += other
+            print(f"  Kept {len(tokens_list)} repetitions...")
 
-            except (ValueError, SyntaxError):
-                continue
+    kept = len(tokens_list)
 
     print(f"\nSwitchboard filtering complete:")
     print(f"  Total examples:      {total}")
@@ -159,7 +192,7 @@ def prepare_dataset():
     dataset = Dataset.from_dict({
         "tokens": tokens,
         "ner_tags": tags
-    })
+    }, features=FEATURES)
 
     # 95/5 split
     split = dataset.train_test_split(test_size=0.05, seed=42)
@@ -177,32 +210,27 @@ def tokenize_and_align_labels(examples, tokenizer):
         examples["tokens"],
         truncation=True,
         is_split_into_words=True,
-        max_length=256
+        max_length=MAX_LENGTH
     )
 
+    encodings = tokenized.encodings
     labels = []
     for i, label in enumerate(examples["ner_tags"]):
-        word_ids = tokenized.word_ids(batch_index=i)
-        previous_word_idx = None
-        label_ids = []
-
-        for word_idx in word_ids:
-            if word_idx is None:
-                label_ids.append(-100)
-            elif word_idx != previous_word_idx:
-                label_ids.append(label[word_idx])
-            else:
-                # Subword: use I- tag if original was B-
-                orig_label = label[word_idx]
-                if LABEL_LIST[orig_label] == "B-REP":
-                    label_ids.append(LABEL2ID["I-REP"])
-                else:
-                    label_ids.append(orig_label)
-            previous_word_idx = word_idx
-
-        labels.append(label_ids)
+        # -1 marks special tokens; it indexes the -100 appended to the labels
+        word_ids = np.array(
+            [-1 if w is None else w for w in encodings[i].word_ids], dtype=np.int64
+        )
+        label_ids = np.append(np.asarray(label, dtype=np.int64), -100)[word_ids]
+
+        # Subword continuation: use I- tag if original was B-
+        is_cont = np.zeros(len(word_ids), dtype=bool)
+        is_cont[1:] = (word_ids[1:] == word_ids[:-1]) & (word_ids[1:] >= 0)
+        label_ids[is_cont & (label_ids == B_REP_ID)] = I_REP_ID
+
+        labels.append(label_ids.tolist())
 
     tokenized["labels"] = labels
+    tokenized["length"] = [len(ids) for ids in tokenized["input_ids"]]
     return tokenized
 
 # ============================================================================
@@ -214,18 +242,10 @@ def compute_metrics(eval_pred, seqeval):
     predictions, labels = eval_pred
     predictions = np.argmax(predictions, axis=2)
 
-    true_predictions = []
-    true_labels = []
-
-    for prediction, label in zip(predictions, labels):
-        true_pred = []
-        true_lab = []
-        for p, l in zip(prediction, label):
-            if l != -100:
-                true_pred.append(LABEL_LIST[p])
-                true_lab.append(LABEL_LIST[l])
-        true_predictions.append(true_pred)
-        true_labels.append(true_lab)
+    label_names = np.array(LABEL_LIST)
+    keep = labels != -100
+    true_predictions = [label_names[p[k]].tolist() for p, k in zip(predictions, keep)]
+    true_labels = [label_names[l[k]].tolist() for l, k in zip(labels, keep)]
 
     results = seqeval.compute(predictions=true_predictions, references=true_labels)
 
@@ -236,6 +256,27 @@ def compute_metrics(eval_pred, seqeval):
         "accuracy": results["overall_accuracy"],
     }
 
+# ============================================================================
+# Tokenized Dataset Cache
+# ============================================================================
+
+def tokenized_cache_dir():
+    """
+    Directory for this run's tokenized splits, keyed on everything that shapes them.
+
+    Hyperparameters (epochs, LR, batch size) aren't part of the key, so sweeps reuse
+    one tokenization. Delete TOKENIZED_CACHE_ROOT after changing parsing code.
+    """
+    key = "|".join(str(part) for part in (
+        Path(__file__).stem,
+        MODEL_NAME,
+        MAX_LENGTH,
+        LABEL_LIST,
+        OVERLAP_THRESHOLD,
+        Path(SWITCHBOARD_PATH).stat().st_mtime_ns,
+    ))
+    return TOKENIZED_CACHE_ROOT / hashlib.md5(key.encode()).hexdigest()
+
 # ============================================================================
 # Main Training
 # ============================================================================
@@ -245,12 +286,10 @@ def main():
     print("REPETITION-ONLY MODEL TRAINING")
     print("=" * 60)
 
-    # Prepare data
-    dataset = prepare_dataset()
-
     # Load tokenizer and model
     print(f"\nLoading {MODEL_NAME}...")
     tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    assert LOWERCASE_WORDS or tokenizer.do_lower_case, f"{MODEL_NAME} is cased; set LOWERCASE_WORDS"
     model = AutoModelForTokenClassification.from_pretrained(
         MODEL_NAME,
         num_labels=len(LABEL_LIST),
@@ -258,21 +297,35 @@ def main():
         label2id=LABEL2ID
     )
 
-    # Tokenize
-    print("Tokenizing...")
-    tokenized_train = dataset["train"].map(
-        lambda x: tokenize_and_align_labels(x, tokenizer),
-        batched=True,
-        remove_columns=dataset["train"].column_names
-    )
-    tokenized_test = dataset["test"].map(
-        lambda x: tokenize_and_align_labels(x, tokenizer),
-        batched=True,
-        remove_columns=dataset["test"].column_names
-    )
+    # Prepare and tokenize data, or reuse an earlier run's tokenized splits
+    cache_dir = tokenized_cache_dir()
+    if cache_dir.exists():
+        print(f"Loading tokenized splits from {cache_dir}...")
+        tokenized = load_from_disk(str(cache_dir))
+    else:
+        dataset = prepare_dataset()
+
+        print("Tokenizing...")
+        tokenized = DatasetDict({
+            split: dataset[split].map(
+                tokenize_and_align_labels,
+                fn_kwargs={"tokenizer": tokenizer},
+                batched=True,
+                num_proc=NUM_PROC,
+                remove_columns=dataset[split].column_names
+            )
+            for split in ("train", "test")
+        })
+        tokenized.save_to_disk(str(cache_dir))
+
+    tokenized_train = tokenized["train"]
+    tokenized_test = tokenized["test"]
 
     # Training setup
-    data_collator = DataCollatorForTokenClassification(tokenizer)
+    data_collator = DataCollatorForTokenClassification(
+        tokenizer,
+        pad_to_multiple_of=8 if USE_FP16 or USE_BF16 else None
+    )
     seqeval = evaluate.load("seqeval")
 
     training_args = TrainingArguments(
@@ -286,6 +339,13 @@ def main():
         save_strategy="epoch",
         load_best_model_at_end=True,
         metric_for_best_model="f1",
+        fp16=USE_FP16,
+        bf16=USE_BF16,
+        tf32=USE_BF16,
+        dataloader_num_workers=DATALOADER_WORKERS,
+        dataloader_pin_memory=True,
+        group_by_length=True,
+        length_column_name="length",
         logging_steps=500,
         report_to="none",
     )
@@ -0,0 +1,23 @@
+"""
+WSGI entry point for the ML server (ml/server.py) under gunicorn.
+
+Usage (from the repo root):
+    gunicorn -k gthread --threads 32 -w 1 -b 127.0.0.1:8000 ml.wsgi:app
+
+Keep a single worker process so all threads share one copy of MODELS (and
+its request batchers); the threads let concurrent requests reach the
+batchers together.
+"""
+
+import sys
+from pathlib import Path
+
+# Add parent to path so we can import ml.server
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from ml.server import app, load_models, setup_logging
+
+setup_logging()
+load_models()
+
+__all__ = ['app']
@@ -4,81 +4,120 @@ Test LLM-based application switching.
 Proves that a local LLM can correctly interpret voice commands and choose the right app/tab.
 """
 
+import os
 import subprocess
 import json
 import time
-import urllib.request
-import urllib.error
+import threading
+import http.client
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:  # Optional: falls back to the stdlib json module
+    orjson = None
 
 # Ollama API endpoint
 OLLAMA_URL = "http://localhost:11434/api/generate"
-MODEL = "llama3.2:3b"
-
-def get_open_apps():
-    """Get list of running foreground applications."""
-    result = subprocess.run(
-        ["osascript", "-e",
-         'tell application "System Events" to get name of every process whose background only is false'],
-        capture_output=True, text=True
-    )
-    apps = [app.strip() for app in result.stdout.split(",")]
-    return apps
-
-def get_iterm_tabs():
-    """Get iTerm windows and tabs."""
-    script = '''tell application "iTerm2"
-        set output to ""
+_OLLAMA = urlsplit(OLLAMA_URL)
+# Override with OLLAMA_MODEL to try a smaller quantized router,
+# e.g. OLLAMA_MODEL=qwen2.5:1.5b-instruct-q4_K_M
+MODEL = os.environ.get("OLLAMA_MODEL", "llama3.2:3b")
+KEEP_ALIVE = "5m"  # Keep the model (and its cached prompt prefix) loaded between calls
+
+# Test cases sent to Ollama at once (it queues anything past OLLAMA_NUM_PARALLEL)
+MAX_CONCURRENT_REQUESTS = 4
+
+# Section separator in the combined AppleScript's output
+SECTION_SEP = "---SECTION---"
+
+# One osascript run gathers apps, iTerm2 tabs and Chrome tabs (one process
+# spawn and script compile instead of three). Each section sits in its own
+# try block so an app that isn't available just leaves its section empty.
+# Tabs come back as "window<TAB>tab<TAB>name" rows; Python turns them into JSON,
+# so titles with quotes or backslashes need no escaping in AppleScript.
+CONTEXT_SCRIPT = f'''set sep to linefeed & "{SECTION_SEP}" & linefeed
+set fieldSep to character id 9
+set output to ""
+
+try
+    tell application "System Events" to set appNames to name of every process whose background only is false
+    set AppleScript's text item delimiters to ", "
+    set output to output & (appNames as text)
+    set AppleScript's text item delimiters to ""
+end try
+set output to output & sep
+
+try
+    tell application "iTerm2"
         set winNum to 1
         repeat with w in windows
             set tabNum to 1
             repeat with t in tabs of w
-                set output to output & "Window " & winNum & ", Tab " & tabNum & ": " & (name of current session of t) & linefeed
+                set output to output & winNum & fieldSep & tabNum & fieldSep & (name of current session of t) & linefeed
                 set tabNum to tabNum + 1
             end repeat
             set winNum to winNum + 1
         end repeat
-        return output
-    end tell'''
-    result = subprocess.run(["osascript", "-e", script], capture_output=True, text=True)
-    return result.stdout.strip()
-
-def get_chrome_tabs():
-    """Get Chrome windows and tabs."""
-    script = '''tell application "Google Chrome"
-        set output to ""
+    end tell
+end try
+set output to output & sep
+
+try
+    tell application "Google Chrome"
         set winNum to 1
         repeat with w in windows
             set tabNum to 1
             repeat with t in tabs of w
-                set output to output & "Window " & winNum & ", Tab " & tabNum & ": " & (title of t) & linefeed
+                set output to output & winNum & fieldSep & tabNum & fieldSep & (title of t) & linefeed
                 set tabNum to tabNum + 1
             end repeat
             set winNum to winNum + 1
         end repeat
-        return output
-    end tell'''
-    result = subprocess.run(["osascript", "-e", script], capture_output=True, text=True)
-    return result.stdout.strip()
+    end tell
+end try
+
+return output'''
+
+def parse_tab_rows(text):
+    """Parse "window<TAB>tab<TAB>name" rows into {window: {tab: name}}."""
+    windows = {}
+    for row in text.splitlines():
+        fields = row.split("\t", 2)
+        if len(fields) == 3:  # Skips continuation lines of names containing newlines
+            window, tab, name = fields
+            windows.setdefault(window, {})[tab] = name
+    return windows
+
+def get_desktop_state():
+    """Get running foreground apps, iTerm tabs and Chrome tabs in one osascript call."""
+    result = subprocess.run(["osascript", "-e", CONTEXT_SCRIPT], capture_output=True, text=True)
+    sections = result.stdout.split(SECTION_SEP)
+    sections += [""] * (3 - len(sections))  # If osascript failed, sections read as empty
+    apps_text, iterm, chrome = (section.strip() for section in sections[:3])
+    apps = [app.strip() for app in apps_text.split(",") if app.strip()]
+    return apps, parse_tab_rows(iterm), parse_tab_rows(chrome)
 
 def build_context():
-    """Build the context string for the LLM."""
-    apps = get_open_apps()
-    iterm = get_iterm_tabs()
-    chrome = get_chrome_tabs()
-
-    context = f"""Available applications: {', '.join(apps)}
-
-iTerm2 tabs:
-{iterm}
+    """Build the context for the LLM as compact JSON (fewer prompt tokens than prose)."""
+    apps, iterm, chrome = get_desktop_state()
 
-Chrome tabs:
-{chrome}"""
-    return context
+    return json.dumps(
+        {"apps": apps, "iterm2_tabs": iterm, "chrome_tabs": chrome},
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
 
-def ask_llm(user_command: str, context: str) -> dict:
-    """Ask the LLM to interpret a voice command and return the action."""
+def build_prompt_prefix(context: str) -> str:
+    """
+    Build everything in the prompt before the command.
 
-    prompt = f"""You interpret voice commands to switch Mac applications.
+    It is identical for every test case, so Ollama can reuse the prefix's KV cache
+    and only prefill the trailing command line.
+    """
+    return f"""You interpret voice commands to switch Mac applications.
 
 CONTEXT:
 {context}
@@ -93,53 +132,92 @@ Command: "third chrome tab" -> {{"action": "focus_tab", "app_name": "Google Chro
 RULES:
 - "terminal" means iTerm2
 - "browser" or "chrome" means Google Chrome
-- Use exact app names from the list
+- Use exact app names from "apps"
+- Tabs are listed as {{"window": {{"tab": "name"}}}}
 - "second" = 2, "third" = 3
 
-Command: "{user_command}"
-JSON:"""
+"""
 
-    start_time = time.time()
+def load_json(data):
+    """Parse JSON text or bytes, using orjson when installed."""
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+# Generate request bodies differ only in the prompt (and num_predict), so the
+# rest is serialized once and the encoded prompt is spliced in between
+REQUEST_HEAD = b'{"model":' + json.dumps(MODEL).encode('utf-8') + b',"prompt":'
 
-    data = json.dumps({
-        "model": MODEL,
-        "prompt": prompt,
+@lru_cache(maxsize=None)
+def request_tail(num_predict: int) -> bytes:
+    """Serialized request fields after the prompt, starting with the separating comma."""
+    fields = json.dumps({
         "stream": False,
+        "format": "json",  # Constrain decoding to valid JSON, so no scanning for braces
+        "keep_alive": KEEP_ALIVE,
         "options": {
             "temperature": 0.1,  # Low temperature for consistent output
-            "num_predict": 100   # Short response
+            "num_predict": num_predict
         }
     }).encode('utf-8')
+    return b',' + fields[1:]  # Drop the object's opening brace
 
-    req = urllib.request.Request(OLLAMA_URL, data=data, headers={'Content-Type': 'application/json'})
-    with urllib.request.urlopen(req) as response:
-        result = json.loads(response.read().decode('utf-8'))
+_thread_state = threading.local()
 
+def get_connection() -> http.client.HTTPConnection:
+    """This thread's keep-alive connection to Ollama (HTTPConnection isn't thread-safe)."""
+    conn = getattr(_thread_state, "conn", None)
+    if conn is None:
+        conn = _thread_state.conn = http.client.HTTPConnection(_OLLAMA.hostname, _OLLAMA.port)
+    return conn
+
+def generate(prompt: str, num_predict: int) -> dict:
+    """POST one non-streaming generate request to Ollama and return its response body."""
+    data = REQUEST_HEAD + json.dumps(prompt).encode('utf-8') + request_tail(num_predict)
+    headers = {'Content-Type': 'application/json'}
+
+    conn = get_connection()
+    try:
+        conn.request("POST", _OLLAMA.path, body=data, headers=headers)
+        response = conn.getresponse()
+    except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+        # Ollama closed the idle connection; reconnect once
+        conn.close()
+        conn.request("POST", _OLLAMA.path, body=data, headers=headers)
+        response = conn.getresponse()
+
+    body = response.read()  # Read fully so the connection can be reused
+    if response.status != 200:
+        raise RuntimeError(f"Ollama returned HTTP {response.status}: {body[:200]!r}")
+    return load_json(body)
+
+def warm_up(prompt_prefix: str):
+    """Load the model and prefill the shared prompt prefix before the timed calls."""
+    generate(prompt_prefix, num_predict=1)
+
+def ask_llm(user_command: str, prompt_prefix: str) -> dict:
+    """Ask the LLM to interpret a voice command and return the action."""
+    prompt = prompt_prefix + f'Command: "{user_command}"\nJSON:'
+
+    start_time = time.time()
+    result = generate(prompt, num_predict=40)  # Longest expected action is ~30 tokens
     elapsed = time.time() - start_time
     raw_response = result.get("response", "")
 
-    # Try to parse JSON from response
+    # JSON mode guarantees valid JSON (unless cut off at num_predict), not an object
     try:
-        # Find JSON in response
-        json_start = raw_response.find("{")
-        json_end = raw_response.rfind("}") + 1
-        if json_start >= 0 and json_end > json_start:
-            json_str = raw_response[json_start:json_end]
-            parsed = json.loads(json_str)
-            parsed["_latency_ms"] = int(elapsed * 1000)
-            parsed["_raw"] = raw_response
-            return parsed
-    except json.JSONDecodeError:
-        pass
+        parsed = load_json(raw_response)
+    except ValueError:  # orjson.JSONDecodeError is a ValueError too
+        parsed = None
 
-    return {"action": "error", "error": "Failed to parse", "_raw": raw_response, "_latency_ms": int(elapsed * 1000)}
+    if isinstance(parsed, dict):
+        parsed["_latency_ms"] = int(elapsed * 1000)
+        parsed["_raw"] = raw_response
+        return parsed
 
+    return {"action": "error", "error": "Failed to parse", "_raw": raw_response, "_latency_ms": int(elapsed * 1000)}
 
-def run_test(command: str, expected_action: str, expected_app: str = None, expected_tab: int = None):
-    """Run a single test case."""
-    context = build_context()
-    result = ask_llm(command, context)
 
+def check_result(result: dict, command: str, expected_action: str, expected_app: str = None, expected_tab: int = None):
+    """Check one test case's LLM result and print PASS/FAIL."""
     latency = result.get("_latency_ms", 0)
     actual_action = result.get("action")
     actual_app = result.get("app_name")
@@ -172,11 +250,11 @@ def run_test(command: str, expected_action: str, expected_app: str = None, expec
 
 def main():
     print("=" * 60)
-    print("LLM App Switching Tests")
+    print(f"LLM App Switching Tests ({MODEL})")
     print("=" * 60)
     print()
 
-    # First, show the context
+    # Build the context once (apps/tabs don't change during the run) and show it
     print("Current Context:")
     print("-" * 40)
     context = build_context()
@@ -212,11 +290,20 @@ def main():
     passed = 0
     failed = 0
 
+    # Byte-identical across calls, so every case after the warm-up reuses its KV cache
+    prompt_prefix = build_prompt_prefix(context)
+    print("Warming up model...")
+    warm_up(prompt_prefix)
+
     print("Running tests...")
     print()
 
-    for command, expected_action, expected_app, expected_tab in tests:
-        if run_test(command, expected_action, expected_app, expected_tab):
+    # Requests are I/O-bound, so overlap them; map() keeps results (and output) in test order
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as pool:
+        results = list(pool.map(lambda test: ask_llm(test[0], prompt_prefix), tests))
+
+    for (command, expected_action, expected_app, expected_tab), result in zip(tests, results):
+        if check_result(result, command, expected_action, expected_app, expected_tab):
             passed += 1
         else:
             failed += 1